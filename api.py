@@ -1,35 +1,101 @@
-# api.py
 import os
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
 from typing import List, Optional
-from datetime import date
 
-from fastapi import FastAPI, Depends, HTTPException, Header, status
+import anyio
+from starlette.concurrency import run_in_threadpool
+from fastapi import FastAPI, Depends, HTTPException, Header, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, EmailStr
 from sqlalchemy.orm import Session
-from openai import OpenAI
 from dotenv import load_dotenv
 
-from database import Base, engine, get_db
-from models import User, CaptionUsage
-from auth import router as auth_router, get_current_user
-from prompts import SYSTEM_PROMPT
+from database import Base, engine, get_db, SessionLocal
+from models import Plan, User
+from auth import (
+    router as auth_router,
+    CurrentUser,
+    bump_token_version,
+    ensure_token_version_column,
+    get_current_user,
+    invalidate_token_version,
+    token_cache,
+)
+import llm
+import quota
+import generation
+from cache import result_cache, make_key
+from disk_cache import disk_cache
+from semantic_cache import semantic_cache
+from singleflight import flights
+from jobs import job_queue
+from plans import plan_cache
+import plans
+from scheduler import Overloaded, scheduler
+from resilience import upstream_guard
+from upstream_http import connection_metrics
+from loop_monitor import loop_monitor
+from passwords import password_hasher
+import jobs
 
 # ---------- .env yükle ----------
 load_dotenv()
 
+# ---------- Batch ayarları ----------
+# Sunucu geneli üst sınır; plan başına sınır plans.max_batch_items
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# ---------- Client kopma kontrolü ----------
+# /generate beklerken bu aralıkla bağlantının hâlâ açık olup olmadığına bakılır
+CLIENT_DISCONNECT_POLL = float(os.getenv("CLIENT_DISCONNECT_POLL", "0.5"))
+
 # ---------- DB tablolarını oluştur ----------
 Base.metadata.create_all(bind=engine)
+# Eski DB'lerde users.token_version yok (JWT sürüm kontrolü)
+ensure_token_version_column(engine)
+# Eski DB'lerde (user_id, date) unique index'i yok -> hak ayırma upsert'i için ekle
+quota.ensure_usage_index(engine)
+# Plan limitleri (tablo boşsa free / pro ile doldurulur)
+plan_cache.load()
+
+
+# ---------- Uygulama yaşam döngüsü ----------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Senkron iş loop'u bloklarsa /admin/metrics'te görünsün
+    if loop_monitor is not None:
+        loop_monitor.start()
+    # Başka worker'ların plan değişikliklerini yakala
+    plans.start_refresher()
+    # bcrypt process havuzu: process'leri başlat, maliyeti hedef süreye göre ölç
+    await password_hasher.start()
+    # Günlük hak sayaçları: tablodan yükle, periyodik olarak geri yaz
+    await run_in_threadpool(quota.load_counters)
+    quota.start_flusher()
+    # İlk /generate bağlantı kurma maliyetini ödemesin
+    await llm.warm_up()
+    llm.start_keepwarm()
+    # Arka plan üretim worker'ları (/jobs)
+    job_queue.start()
+    yield
+    # Yarım kalan işler kuyruğa geri bırakılır
+    await job_queue.stop()
+    await quota.stop_flusher()
+    plans.stop_refresher()
+    password_hasher.shutdown()
+    if loop_monitor is not None:
+        loop_monitor.stop()
+    # Kapanışta upstream bağlantı havuzunu kapat
+    await llm.aclose()
 
-# ---------- OpenAI client ----------
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise RuntimeError("OPENAI_API_KEY .env dosyasından okunamadı.")
-
-client = OpenAI(api_key=api_key)
 
 # ---------- FastAPI app ----------
-app = FastAPI(title="Caption & Hashtag API")
+app = FastAPI(title="Caption & Hashtag API", lifespan=lifespan)
 
 # ---------- CORS ----------
 app.add_middleware(
@@ -38,8 +104,40 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-Cache"],  # frontend okuyabilsin
 )
 
+
+# ---------- Yük atma (429) ----------
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    """
+    Upstream önündeki sıra dolu / bekleme süresi doldu -> hızlı 429.
+    Upstream çökük (circuit breaker açık) ya da kullanılabilir OpenAI key'i yok -> 503.
+    Retry-After sıradaki iş sayısı ve ortalama üretim süresinden hesaplanır.
+    """
+    return JSONResponse(
+        status_code=503 if exc.reason in ("circuit_open", "no_upstream_key") else 429,
+        content={
+            "detail": "Sunucu su an cok yogun, lutfen biraz sonra tekrar dene.",
+            "retry_after": exc.retry_after,
+        },
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+class ClientDisconnected(Exception):
+    """
+    Cevap beklenirken client bağlantıyı kapattı (sekme kapandı, uygulama arka plana geçti).
+    """
+
+
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    # Okuyan kimse yok; nginx'teki gibi 499 (loglarda ayırt edilsin diye)
+    return Response(status_code=499)
+
+
 # ---------- Auth router ----------
 # /auth/register, /auth/login, /auth/me
 app.include_router(auth_router, prefix="/auth", tags=["auth"])
@@ -55,6 +153,47 @@ class GenerateResponse(BaseModel):
     result: str
 
 
+class BatchGenerateRequest(BaseModel):
+    items: List[GenerateRequest]
+
+
+class JobOut(BaseModel):
+    job_id: str
+    status: str
+    result: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+def _job_out(job) -> JobOut:
+    return JobOut(
+        job_id=job.id,
+        status=job.status,
+        result=job.result,
+        error=job.error,
+        attempts=job.attempts,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+    )
+
+
+class LimitsUpdate(BaseModel):
+    max_concurrency: Optional[int] = None
+    max_queue: Optional[int] = None
+    queue_timeout: Optional[float] = None
+
+
+class PlanIn(BaseModel):
+    # None -> sınırsız
+    daily_limit: Optional[int] = None
+    monthly_limit: Optional[int] = None
+    max_batch_items: int = 100
+    max_concurrency: int = 1
+    priority_weight: float = 1.0
+
+
 class UserAdminOut(BaseModel):
     id: int
     email: EmailStr
@@ -76,25 +215,40 @@ def require_admin(admin_secret: str = Header(None, alias="x-admin-secret")) -> b
     return True
 
 
-# ---------- Caption üretim mantığı ----------
-def generate_captions_and_hashtags(description: str, niche: str = "") -> str:
-    user_prompt = f"""
-Nis: {niche}
-
-Video/Post aciklamasi:
-\"\"\"{description}\"\"\"
-"""
+async def until_disconnect(request: Request, coro):
+    """
+    coro'yu çalıştırır; client bu arada koparsa iptal eder (upstream isteği de kapanır)
+    ve ClientDisconnected fırlatır.
+    StreamingResponse'lar kopmayı zaten Starlette üzerinden iptal olarak alıyor.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=CLIENT_DISCONNECT_POLL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                break
+    finally:
+        task.cancel()
+
+    # İptal tamamlansın (singleflight / scheduler temizliği) ama sonucu önemli değil
+    await asyncio.gather(task, return_exceptions=True)
+    raise ClientDisconnected()
+
+
+def plan_exists(name: str) -> bool:
+    """
+    Bu worker'ın cache'inde yoksa başka worker yeni eklemiş olabilir -> bir kez yenile.
+    """
+    return plan_cache.exists(name) or (plan_cache.refresh_if_changed() and plan_cache.exists(name))
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.8,
-    )
 
-    return response.choices[0].message.content.strip()
+def wants_fresh(cache_control: Optional[str]) -> bool:
+    """
+    Cache-Control: no-cache -> kullanıcı bilerek yeni bir varyasyon istiyor.
+    """
+    return bool(cache_control) and "no-cache" in cache_control.lower()
 
 
 # ---------- Endpointler ----------
@@ -120,11 +274,14 @@ def admin_set_plan(
         raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
 
     # Plan güncelle
-    if plan not in ["free", "pro"]:
-        raise HTTPException(status_code=400, detail="Plan 'free' veya 'pro' olmalı")
+    if not plan_exists(plan):
+        raise HTTPException(status_code=400, detail=f"Gecersiz plan. Gecerli planlar: {', '.join(plan_cache.names())}")
 
     user.plan = plan
+    # Eski plan claim'li token'lar geçersiz olsun
+    bump_token_version(user)
     db.commit()
+    invalidate_token_version(user.id)
     db.refresh(user)
 
     return {
@@ -134,64 +291,409 @@ def admin_set_plan(
     }
 
 @app.post("/generate", response_model=GenerateResponse)
-def generate(
+async def generate(
     req: GenerateRequest,
-    current_user: User = Depends(get_current_user),  # 🔐 JWT zorunlu
+    request: Request,
+    response: Response,
+    current_user: CurrentUser = Depends(get_current_user),  # 🔐 JWT zorunlu
     db: Session = Depends(get_db),
+    cache_control: Optional[str] = Header(None),
 ):
     """
     Caption & hashtag üretimi.
     - Bu endpoint'e erişmek için Authorization: Bearer <token> şart.
-    - plan = "free" ise günde 1 kullanım hakkı.
-    - plan = "pro" ise sınırsız.
+    - Günlük / aylık hak kullanıcının planından gelir (plans tablosu, limitsiz plan olabilir).
+    - Aynı niş + açıklama cache'ten döner (X-Cache: HIT).
+      Cache-Control: no-cache ile her zaman yeni üretim yapılır.
+    - Upstream sırası doluysa 429 + Retry-After (hak düşülmez).
+    - Client cevap gelmeden koparsa upstream çağrısı iptal edilir, hak geri verilir.
     """
     if not req.description.strip():
         raise HTTPException(status_code=400, detail="description bos olamaz.")
 
-    # ---------- Free plan için günlük limit kontrolü ----------
-    usage = None
-    if getattr(current_user, "plan", "free") == "free":
-        today = date.today()
-        usage = (
-            db.query(CaptionUsage)
-            .filter(
-                CaptionUsage.user_id == current_user.id,
-                CaptionUsage.date == today,
-            )
-            .first()
-        )
+    # Sıra zaten doluysa hak ayırmadan reddet
+    scheduler.check_admission(current_user.id, current_user.plan)
 
-        if usage and usage.count >= 1:
-            # Free kullanıcı bugün zaten 1 kez kullanmış
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Free planda gunde 1 caption uretebilirsin. Daha fazlasi icin pro plana gec.",
-            )
+    # ---------- Free plan için günlük hak ayır (limit doluysa 403) ----------
+    reserved_on = await quota.reserve(db, current_user)
 
     # ---------- Caption üret ----------
-    result_text = generate_captions_and_hashtags(
-        description=req.description,
-        niche=req.niche or "",
+    try:
+        result_text, from_cache = await until_disconnect(
+            request,
+            generation.generate(
+                description=req.description,
+                niche=req.niche or "",
+                fresh=wants_fresh(cache_control),
+                user_id=current_user.id,
+                plan=current_user.plan,
+            ),
+        )
+    except Exception:
+        # Üretim başarısız / client koptu -> ayrılan hakkı geri ver
+        await quota.release(db, current_user.id, reserved_on)
+        raise
+
+    response.headers["X-Cache"] = "HIT" if from_cache else "MISS"
+    return GenerateResponse(result=result_text)
+
+
+# ---------- SSE helpers ----------
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _stream_generation(req: GenerateRequest, current_user: CurrentUser, reserved_on, fresh: bool):
+    """
+    Üretimi SSE olarak iletir.
+    - event: delta -> {"text": "..."}
+    - event: done  -> {"result": "<tam metin>", "usage": {...}, "cached": bool}
+    - event: error -> {"detail": "...", "retry_after": saniye (sadece yoğunlukta)}
+    Hak reserve() ile bir kez ayrıldı; akış 'done' ile bitmezse geri verilir.
+    """
+    completed = False
+
+    try:
+        async for event, data in generation.stream(
+            description=req.description,
+            niche=req.niche or "",
+            fresh=fresh,
+            user_id=current_user.id,
+            plan=current_user.plan,
+        ):
+            if event == "done":
+                completed = True
+            yield _sse(event, data)
+    except Overloaded as exc:
+        # Akış başladıktan sonra sırada süre doldu -> 429 yerine error event'i
+        yield _sse(
+            "error",
+            {"detail": "Sunucu su an cok yogun, lutfen biraz sonra tekrar dene.", "retry_after": exc.retry_after},
+        )
+    except Exception:
+        yield _sse("error", {"detail": "Uretim sirasinda hata olustu."})
+    finally:
+        if not completed:
+            # Response dependency'leri kapanmış olabilir -> ayrı session.
+            # Client koptuysa scope iptal edilmiştir, release yine de bitsin.
+            with anyio.CancelScope(shield=True):
+                db = SessionLocal()
+                try:
+                    await quota.release(db, current_user.id, reserved_on)
+                finally:
+                    db.close()
+
+
+@app.post("/generate/stream")
+async def generate_stream(
+    req: GenerateRequest,
+    current_user: CurrentUser = Depends(get_current_user),  # 🔐 JWT zorunlu
+    db: Session = Depends(get_db),
+    cache_control: Optional[str] = Header(None),
+):
+    """
+    /generate ile aynı kurallar, ama sonuç Server-Sent Events olarak akar.
+    İlk caption birkaç yüz ms içinde ekrana düşer; son event 'done'
+    tam metni ve token kullanımını taşır.
+    """
+    if not req.description.strip():
+        raise HTTPException(status_code=400, detail="description bos olamaz.")
+
+    # Limit ve yoğunluk kontrolü akış başlamadan -> 403 / 429 normal HTTP cevabı olarak döner
+    scheduler.check_admission(current_user.id, current_user.plan)
+    reserved_on = await quota.reserve(db, current_user)
+
+    return StreamingResponse(
+        _stream_generation(req, current_user, reserved_on, wants_fresh(cache_control)),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # proxy buffer'ı kapat
+        },
     )
 
-    # ---------- Kullanım kaydı güncelle (sadece free için) ----------
-    if getattr(current_user, "plan", "free") == "free":
-        today = date.today()
-        if not usage:
-            usage = CaptionUsage(
-                user_id=current_user.id,
-                date=today,
-                count=0,
-            )
-            db.add(usage)
 
-        usage.count += 1
-        db.commit()
-        db.refresh(usage)
+async def _stream_batch(groups: list, current_user: CurrentUser, reserved_on, fresh: bool):
+    """
+    Tekilleştirilmiş item'ları en fazla BATCH_CONCURRENCY paralel üretir (planın kullanıcı
+    başı max_concurrency'si daha küçükse o kadar; fazlası scheduler'da kendi sınırında
+    bekleyip queue_timeout'a düşmesin), her biri bitince NDJSON satırı yazar
+    (aynı item'ın tüm index'leri için).
+    Başarısız / yarım kalan item'ların hakkı sonda topluca geri verilir.
+    """
+    user_cap = plan_cache.get(current_user.plan).max_concurrency
+    semaphore = asyncio.Semaphore(max(1, min(BATCH_CONCURRENCY, user_cap)))
+
+    async def run(item: GenerateRequest, indexes: list):
+        async with semaphore:
+            try:
+                result_text, from_cache = await generation.generate(
+                    description=item.description,
+                    niche=item.niche or "",
+                    fresh=fresh,
+                    user_id=current_user.id,
+                    plan=current_user.plan,
+                )
+            except Overloaded as exc:
+                return indexes, exc, False
+            except Exception:
+                return indexes, None, False
+        return indexes, result_text, from_cache
+
+    tasks = [asyncio.ensure_future(run(item, indexes)) for item, indexes in groups]
+    succeeded = 0
+
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            indexes, result_text, from_cache = await next_done
+            if isinstance(result_text, Overloaded):
+                lines = [
+                    {
+                        "index": i,
+                        "status": "error",
+                        "detail": "Sunucu su an cok yogun, lutfen biraz sonra tekrar dene.",
+                        "retry_after": result_text.retry_after,
+                    }
+                    for i in indexes
+                ]
+            elif result_text is None:
+                lines = [
+                    {"index": i, "status": "error", "detail": "Uretim sirasinda hata olustu."}
+                    for i in indexes
+                ]
+            else:
+                succeeded += 1
+                lines = [
+                    {"index": i, "status": "ok", "result": result_text, "cached": from_cache}
+                    for i in indexes
+                ]
+            yield "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+        with anyio.CancelScope(shield=True):
+            db = SessionLocal()
+            try:
+                await quota.release(db, current_user.id, reserved_on, amount=len(groups) - succeeded)
+            finally:
+                db.close()
+
+
+@app.post("/generate/batch")
+async def generate_batch(
+    req: BatchGenerateRequest,
+    current_user: CurrentUser = Depends(get_current_user),  # 🔐 JWT zorunlu
+    db: Session = Depends(get_db),
+    cache_control: Optional[str] = Header(None),
+):
+    """
+    Toplu üretim (ajans müşterileri için).
+    - Aynı niş + açıklamaya sahip item'lar bir kez üretilir.
+    - Hak kontrolü tek seferde yapılır: tekil item sayısı kadar hak ayrılır.
+    - Sonuçlar NDJSON olarak, her item bittikçe akar:
+      {"index": 3, "status": "ok", "result": "...", "cached": false}
+      {"index": 5, "status": "error", "detail": "..."}
+      {"index": 7, "status": "error", "detail": "...", "retry_after": 4}  (yoğunluk)
+    - Bir item'ın hatası batch'i bozmaz; hatalı item'ın hakkı geri verilir.
+    """
+    if not req.items:
+        raise HTTPException(status_code=400, detail="items bos olamaz.")
+    max_items = min(BATCH_MAX_ITEMS, plan_cache.get(current_user.plan).max_batch_items)
+    if len(req.items) > max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Bir batch'te en fazla {max_items} item olabilir.",
+        )
+
+    # Tekilleştir: key -> (item, [index, ...]); boş açıklamalar direkt hata satırı
+    invalid_lines = []
+    grouped = {}
+    for i, item in enumerate(req.items):
+        if not item.description.strip():
+            invalid_lines.append({"index": i, "status": "error", "detail": "description bos olamaz."})
+            continue
+        key = make_key(item.niche or "", item.description)
+        if key in grouped:
+            grouped[key][1].append(i)
+        else:
+            grouped[key] = (item, [i])
+    groups = list(grouped.values())
+
+    if groups:
+        scheduler.check_admission(current_user.id, current_user.plan)
+    reserved_on = await quota.reserve(db, current_user, amount=len(groups)) if groups else None
+
+    async def body():
+        if invalid_lines:
+            yield "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in invalid_lines)
+        if groups:
+            async for chunk in _stream_batch(groups, current_user, reserved_on, wants_fresh(cache_control)):
+                yield chunk
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+# ---------- İş kuyruğu (uzun süren üretimler için submit / poll) ----------
+@app.post("/jobs", response_model=JobOut, status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(
+    req: GenerateRequest,
+    current_user: CurrentUser = Depends(get_current_user),  # 🔐 JWT zorunlu
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    """
+    Üretimi kuyruğa atar, hemen job_id döner. Sonuç GET /jobs/{job_id} ile alınır.
+    - Kötü bağlantıdaki mobil client aynı Idempotency-Key ile tekrar denerse
+      yeni iş açılmaz, mevcut iş döner (ikinci kez ödeme yok).
+    - Free plan hakkı submit anında ayrılır; iş sonunda başarısız olursa iade edilir.
+    """
+    if not req.description.strip():
+        raise HTTPException(status_code=400, detail="description bos olamaz.")
+
+    if idempotency_key:
+        existing = await run_in_threadpool(
+            jobs.get_job_by_idempotency_key, db, current_user.id, idempotency_key
+        )
+        if existing:
+            return _job_out(existing)
+
+    reserved_on = await quota.reserve(db, current_user)
+
+    job = await run_in_threadpool(
+        jobs.create_job,
+        db,
+        current_user.id,
+        req.niche or "",
+        req.description,
+        reserved_on,
+        idempotency_key,
+    )
+    if job is None:
+        # Aynı key ile paralel gelen istek kazandı -> onun işini dön
+        await quota.release(db, current_user.id, reserved_on)
+        job = await run_in_threadpool(
+            jobs.get_job_by_idempotency_key, db, current_user.id, idempotency_key
+        )
+
+    job_queue.notify()
+    return _job_out(job)
+
+
+@app.get("/jobs/{job_id}", response_model=JobOut)
+def get_job(
+    job_id: str,
+    current_user: CurrentUser = Depends(get_current_user),  # 🔐 JWT zorunlu
+    db: Session = Depends(get_db),
+):
+    """
+    İşin durumu: queued / running / done / failed. done ise result dolu.
+    """
+    job = jobs.get_job(db, job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Is bulunamadi")
+    return _job_out(job)
+
 
-    return GenerateResponse(result=result_text)
 # ---------- ADMIN ENDPOINTLER ----------
 
+@app.get("/admin/metrics")
+def admin_metrics(_: bool = Depends(require_admin)):
+    """
+    Performans sayaçları (cache vb.).
+    """
+    return {
+        "cache": {
+            "l1": result_cache.stats(),
+            "l2": disk_cache.stats() if disk_cache is not None else None,
+            "semantic": semantic_cache.stats() if semantic_cache is not None else None,
+        },
+        "singleflight": flights.stats(),
+        "jobs": job_queue.stats(),
+        "scheduler": scheduler.stats(),
+        "quota": quota.stats(),
+        "auth_token_cache": token_cache.stats() if token_cache is not None else None,
+        "password_hashing": password_hasher.stats(),
+        "event_loop": loop_monitor.stats() if loop_monitor is not None else None,
+        "upstream": llm.backend.stats(),
+        "upstream_http": connection_metrics.stats(),
+        "upstream_resilience": upstream_guard.stats(),
+        "upstream_cancelled": llm.cancel_stats,
+    }
+
+
+@app.get("/admin/limits")
+def admin_get_limits(_: bool = Depends(require_admin)):
+    """
+    Upstream önündeki eşzamanlılık / sıra limitleri (bu process için).
+    """
+    return scheduler.limits()
+
+
+@app.post("/admin/limits")
+async def admin_set_limits(req: LimitsUpdate, _: bool = Depends(require_admin)):
+    """
+    Limitleri restart olmadan değiştir. Gönderilmeyen alanlar aynı kalır.
+    async: scheduler sadece event loop içinden değiştirilebilir (bekleyenler loop'ta uyandırılır).
+    Not: her uvicorn worker'ı kendi limitini tutar; çok worker'da her birine ayrı uygulanır.
+    Örnek body: {"max_concurrency": 32, "max_queue": 100, "queue_timeout": 10}
+    """
+    if req.max_concurrency is not None and req.max_concurrency < 1:
+        raise HTTPException(status_code=400, detail="max_concurrency en az 1 olmali")
+    if req.max_queue is not None and req.max_queue < 0:
+        raise HTTPException(status_code=400, detail="max_queue negatif olamaz")
+    if req.queue_timeout is not None and req.queue_timeout <= 0:
+        raise HTTPException(status_code=400, detail="queue_timeout pozitif olmali")
+
+    scheduler.configure(
+        max_concurrency=req.max_concurrency,
+        max_queue=req.max_queue,
+        queue_timeout=req.queue_timeout,
+    )
+    return scheduler.limits()
+
+
+@app.get("/admin/plans")
+def admin_get_plans(_: bool = Depends(require_admin)):
+    """
+    Planlar ve limitleri (bu worker'ın cache'indeki hali).
+    """
+    return plan_cache.stats()
+
+
+@app.put("/admin/plans/{name}")
+def admin_put_plan(
+    name: str,
+    req: PlanIn,
+    db: Session = Depends(get_db),
+    _: bool = Depends(require_admin),
+):
+    """
+    Plan ekle / güncelle (deploy gerekmez). Gönderilmeyen limitler sınırsız sayılır.
+    Bu worker hemen, diğerleri PLANS_REFRESH_INTERVAL içinde yeni limitleri kullanır.
+    Örnek body: {"daily_limit": 20, "monthly_limit": 300, "max_batch_items": 50,
+                 "max_concurrency": 2, "priority_weight": 2}
+    """
+    if req.daily_limit is not None and req.daily_limit < 0:
+        raise HTTPException(status_code=400, detail="daily_limit negatif olamaz")
+    if req.monthly_limit is not None and req.monthly_limit < 0:
+        raise HTTPException(status_code=400, detail="monthly_limit negatif olamaz")
+    if req.max_batch_items < 1 or req.max_concurrency < 1:
+        raise HTTPException(status_code=400, detail="max_batch_items ve max_concurrency en az 1 olmali")
+    if req.priority_weight <= 0:
+        raise HTTPException(status_code=400, detail="priority_weight pozitif olmali")
+
+    plan = db.get(Plan, name) or Plan(name=name)
+    for field, value in req.model_dump().items():
+        setattr(plan, field, value)
+    plan.updated_at = datetime.utcnow()
+    db.add(plan)
+    db.commit()
+
+    plan_cache.load()
+    return plan_cache.get(name).as_dict()
+
+
 @app.get("/admin/users", response_model=List[UserAdminOut])
 def admin_list_users(
     db: Session = Depends(get_db),
@@ -203,7 +705,7 @@ def admin_list_users(
 ):
     """
     Kullanıcı listesi:
-    - plan: 'free' veya 'pro' filtresi (opsiyonel)
+    - plan: plan adı filtresi (opsiyonel)
     - email: kısmi eşleşme (opsiyonel)
     - limit / offset: pagination
     """
@@ -285,20 +787,23 @@ def admin_set_plan(
 ):
     """
     Kullanıcının plan'ını güncelle:
-    - plan: 'free' veya 'pro'
+    - plan: plans tablosundaki bir plan adı (GET /admin/plans)
     Örnek:
     POST /admin/set-plan?email=x%40gmail.com&plan=pro
     Header: x-admin-secret: <ADMIN_SECRET>
     """
-    if plan not in ("free", "pro"):
-        raise HTTPException(status_code=400, detail="Plan 'free' veya 'pro' olmali")
+    if not plan_exists(plan):
+        raise HTTPException(status_code=400, detail=f"Gecersiz plan. Gecerli planlar: {', '.join(plan_cache.names())}")
 
     user = db.query(User).filter(User.email == email).first()
     if not user:
         raise HTTPException(status_code=404, detail="Kullanici bulunamadi")
 
     user.plan = plan
+    # Eski plan claim'li token'lar geçersiz olsun
+    bump_token_version(user)
     db.commit()
+    invalidate_token_version(user.id)
     db.refresh(user)
 
     return user
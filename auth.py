@@ -1,15 +1,25 @@
 # auth.py
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from database import get_db
+from database import SessionLocal, get_db
 from models import User
+from passwords import password_hasher
+from plans import DEFAULT_PLAN
+from scheduler import Overloaded
 from schemas import UserCreate, Token, UserPublic
 
 # ------------------------------------------------------------
@@ -18,8 +28,12 @@ from schemas import UserCreate, Token, UserPublic
 SECRET_KEY = "CHANGE_THIS_SECRET_KEY_123456"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 gün
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Token'daki sürüm DB'deki ile bu kadar saniyede bir karşılaştırılır (plan değişikliği
+# en geç bu sürede eski token'ları geçersiz kılar; aynı worker'da hemen)
+TOKEN_VERSION_TTL = float(os.getenv("TOKEN_VERSION_TTL", "30"))
+# Doğrulanmış token cache'i: aynı token tekrar gelince imza / claim çözümü atlanır
+TOKEN_CACHE_ENABLED = os.getenv("TOKEN_CACHE_ENABLED", "1") == "1"
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
 
 # Swagger / docs için tokenUrl -> /auth/login
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
@@ -29,13 +43,15 @@ router = APIRouter()
 
 # ------------------------------------------------------------
 # Password helpers
+# Request yolunda bcrypt passwords.py'deki process havuzunda çalışır;
+# senkron olanlar script'ler (set_pro, bench seed) için.
 # ------------------------------------------------------------
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return password_hasher.hash_sync(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_hasher.verify_sync(plain_password, hashed_password)
 
 
 # ------------------------------------------------------------
@@ -49,6 +65,184 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
+def create_user_token(user: User) -> str:
+    """
+    Yetkilendirme için gereken her şey claim'lerde -> istek başına kullanıcı sorgusu yok.
+    """
+    return create_access_token(
+        data={
+            "sub": user.email,
+            "uid": user.id,
+            "plan": user.plan,
+            "ver": user.token_version or 0,
+        }
+    )
+
+
+class CurrentUser:
+    """
+    Token'dan gelen kullanıcı (DB objesi değil). api.py sadece id / email / plan kullanıyor.
+    """
+
+    __slots__ = ("id", "email", "plan", "token_version")
+
+    def __init__(self, id: int, email: str, plan: str, token_version: int = 0):
+        self.id = id
+        self.email = email
+        self.plan = plan
+        self.token_version = token_version
+
+
+# ------------------------------------------------------------
+# Doğrulanmış token LRU cache'i
+# ------------------------------------------------------------
+class TokenCache:
+    """
+    token özeti -> (kullanıcı, exp, claim'li_mi). Ham token saklanmaz (blake2b özeti).
+    - LRU, en fazla max_entries kayıt
+    - exp'i geçen kayıt hit sayılmaz, silinir (jwt.decode zaten reddederdi)
+    - plan değişince (invalidate_token_version) kullanıcının kayıtları silinir; diğer worker'lar
+      için hit'te de token sürümü kontrol ediliyor
+    Ölçüm: hit ve miss yolunun ortalama süresi -> hit başına kazanılan µs.
+    get / set event loop'tan, invalidate_user threadpool'dan (sync admin endpoint'leri)
+    ve set_pro.py'den çağrılıyor -> sözlük işlemleri kilit altında (çekişmesiz kilit ~µs altı).
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[bytes, tuple]" = OrderedDict()  # key -> (user, exp, has_claims)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.hit_seconds_total = 0.0
+        self.miss_seconds_total = 0.0
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.blake2b(token.encode("utf-8"), digest_size=16).digest()
+
+    def get(self, key: bytes) -> Optional[tuple]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+
+            user, exp, has_claims = entry
+            if exp and exp <= time.time():
+                del self._data[key]
+                self.expirations += 1
+                return None
+
+            self._data.move_to_end(key)
+            return user, has_claims
+
+    def set(self, key: bytes, user: CurrentUser, exp: float, has_claims: bool) -> None:
+        with self._lock:
+            self._data[key] = (user, exp, has_claims)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key: bytes) -> None:
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            stale = [key for key, (user, _, _) in self._data.items() if user.id == user_id]
+            for key in stale:
+                del self._data[key]
+            self.invalidations += len(stale)
+
+    def record_hit(self, seconds: float) -> None:
+        self.hits += 1
+        self.hit_seconds_total += seconds
+
+    def record_miss(self, seconds: float) -> None:
+        self.misses += 1
+        self.miss_seconds_total += seconds
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        hit_us = self.hit_seconds_total / self.hits * 1e6 if self.hits else 0.0
+        miss_us = self.miss_seconds_total / self.misses * 1e6 if self.misses else 0.0
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "hit_us_avg": round(hit_us, 1),
+            "miss_us_avg": round(miss_us, 1),
+            "saved_us_per_hit": round(max(miss_us - hit_us, 0.0), 1) if self.hits and self.misses else 0.0,
+        }
+
+
+token_cache = TokenCache(TOKEN_CACHE_MAX_ENTRIES) if TOKEN_CACHE_ENABLED else None
+
+
+# ------------------------------------------------------------
+# Token sürüm cache'i: user_id -> (token_version, okunma zamanı)
+# ------------------------------------------------------------
+_token_versions: dict = {}
+
+
+def _load_token_version(user_id: int) -> Optional[int]:
+    db = SessionLocal()
+    try:
+        return db.query(User.token_version).filter(User.id == user_id).scalar()
+    finally:
+        db.close()
+
+
+async def _current_token_version(user_id: int) -> Optional[int]:
+    cached = _token_versions.get(user_id)
+    now = time.monotonic()
+    if cached is not None and now - cached[1] < TOKEN_VERSION_TTL:
+        return cached[0]
+
+    version = await run_in_threadpool(_load_token_version, user_id)
+    _token_versions[user_id] = (version, now)
+    return version
+
+
+def bump_token_version(user: User) -> None:
+    """
+    Plan değişikliği gibi claim'leri eskiten işlemlerde çağrılır (commit'ten önce).
+    Commit'ten sonra invalidate_token_version da çağrılmalı.
+    """
+    user.token_version = (user.token_version or 0) + 1
+
+
+def invalidate_token_version(user_id: int) -> None:
+    """
+    bump_token_version commit edildikten sonra. Commit'ten önce silinirse araya giren
+    istek eski sürümü tekrar okuyup TOKEN_VERSION_TTL boyunca cache'ler ve yeni token reddedilir.
+    """
+    _token_versions.pop(user_id, None)
+    if token_cache is not None:
+        token_cache.invalidate_user(user_id)
+
+
+def ensure_token_version_column(engine: Engine) -> None:
+    """
+    create_all var olan tabloya kolon eklemez; eski caption.db için tek seferlik.
+    """
+    columns = {column["name"] for column in inspect(engine).get_columns(User.__tablename__)}
+    if "token_version" not in columns:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0"))
+
+
 # ------------------------------------------------------------
 # DB helpers
 # ------------------------------------------------------------
@@ -56,40 +250,112 @@ def get_user_by_email(db: Session, email: str) -> Optional[User]:
     return db.query(User).filter(User.email == email).first()
 
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
-    user = get_user_by_email(db, email)
+def _save_password_hash(db: Session, user: User, hashed_password: str) -> None:
+    user.hashed_password = hashed_password
+    db.commit()
+
+
+async def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
+    user = await run_in_threadpool(get_user_by_email, db, email)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await password_hasher.verify(password, user.hashed_password):
         return None
+
+    # bcrypt maliyeti değişmişse (BCRYPT_ROUNDS / kalibrasyon) şifre elimizdeyken yeniden hash'le
+    if password_hasher.needs_rehash(user.hashed_password):
+        try:
+            new_hash = await password_hasher.hash(password)
+        except Overloaded:
+            # Havuz yoğun -> login'i bekletme, bir sonraki girişte tekrar denenir
+            return user
+        await run_in_threadpool(_save_password_hash, db, user, new_hash)
+        password_hasher.rehashed += 1
     return user
 
 
 # ------------------------------------------------------------
 # AUTH dependency -> api.py burayı kullanıyor
 # ------------------------------------------------------------
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
-) -> User:
-    credentials_exception = HTTPException(
+def _load_user_by_email(email: str) -> Optional[CurrentUser]:
+    db = SessionLocal()
+    try:
+        user = get_user_by_email(db, email=email)
+        if user is None:
+            return None
+        return CurrentUser(user.id, user.email, user.plan, user.token_version or 0)
+    finally:
+        db.close()
+
+
+def _credentials_exception(detail: str = "Gecersiz kimlik bilgileri.") -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Gecersiz kimlik bilgileri.",
+        detail=detail,
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+
+async def _verify_token(token: str) -> tuple:
+    """
+    İmza + claim doğrulama (cache miss yolu). (kullanıcı, exp, claim'li_mi) döner.
+    """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
-            raise credentials_exception
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
-
-    user = get_user_by_email(db, email=email)
-    if user is None:
-        raise credentials_exception
-
+        raise _credentials_exception()
+
+    exp = float(payload.get("exp") or 0)
+    user_id = payload.get("uid")
+    if user_id is None:
+        # Claim'siz eski token: süresi dolana kadar DB'den çözülür
+        user = await run_in_threadpool(_load_user_by_email, email)
+        if user is None:
+            raise _credentials_exception()
+        return user, exp, False
+
+    version = await _current_token_version(user_id)
+    if version is None:
+        # Kullanıcı silinmiş
+        raise _credentials_exception()
+    if version != payload.get("ver", 0):
+        raise _credentials_exception("Hesap bilgilerin degisti, lutfen tekrar giris yap.")
+
+    return CurrentUser(user_id, email, payload.get("plan") or DEFAULT_PLAN, version), exp, True
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> CurrentUser:
+    """
+    Kullanıcı id / plan token claim'lerinden okunur; DB'ye sadece sürüm kontrolü için,
+    TOKEN_VERSION_TTL'de bir (PK ile tek kolon) gidilir. Sürüm değiştiyse (plan
+    güncellendi) token geçersiz -> client tekrar giriş yapar, yeni plan claim'e girer.
+    Aynı token tekrar gelirse imza / claim çözümü token_cache'ten atlanır.
+    """
+    started = time.perf_counter()
+    key = token_cache.key(token) if token_cache is not None else None
+
+    entry = token_cache.get(key) if key is not None else None
+    if entry is not None:
+        user, has_claims = entry
+        version = await _current_token_version(user.id)
+        if version is not None and version == user.token_version:
+            token_cache.record_hit(time.perf_counter() - started)
+            return user
+        token_cache.discard(key)
+        if version is None:
+            # Kullanıcı silinmiş
+            raise _credentials_exception()
+        if has_claims:
+            raise _credentials_exception("Hesap bilgilerin degisti, lutfen tekrar giris yap.")
+        # Claim'siz eski token'ın kullanıcısı değişmiş -> DB'den yeniden çöz
+
+    user, exp, has_claims = await _verify_token(token)
+    if key is not None:
+        token_cache.set(key, user, exp, has_claims)
+        token_cache.record_miss(time.perf_counter() - started)
     return user
 
 
@@ -97,14 +363,9 @@ async def get_current_user(
 # ROUTES
 # ------------------------------------------------------------
 
-@router.post("/register", response_model=UserPublic)
-def register(
-    user_in: UserCreate,
-    request: Request,
-    db: Session = Depends(get_db),
-):
+def _check_registration(db: Session, email: str, device_id: Optional[str]) -> None:
     # 1) Email zaten var mı?
-    existing = get_user_by_email(db, user_in.email)
+    existing = get_user_by_email(db, email)
     if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -112,13 +373,12 @@ def register(
         )
 
     # 2) device_id limiti (free hesaplar icin)
-    device_id = getattr(user_in, "device_id", None)
     if device_id:
         existing_device = (
             db.query(User)
             .filter(
                 User.device_id == device_id,
-                User.plan == "free",  # sadece free hesapları kısıtla
+                User.plan == DEFAULT_PLAN,  # sadece ücretsiz (varsayılan plan) hesapları kısıtla
             )
             .first()
         )
@@ -128,6 +388,24 @@ def register(
                 detail="Bu cihaz ile zaten bir ucretsiz hesap olusturulmus.",
             )
 
+
+def _create_user(db: Session, user: User) -> User:
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+@router.post("/register", response_model=UserPublic)
+async def register(
+    user_in: UserCreate,
+    request: Request,
+    db: Session = Depends(get_db),
+):
+    # 1-2) Email / cihaz kontrolleri (DB işi threadpool'da)
+    device_id = getattr(user_in, "device_id", None)
+    await run_in_threadpool(_check_registration, db, user_in.email, device_id)
+
     # 3) IP'yi al (Railway behind proxy -> x-forwarded-for)
     xff = request.headers.get("x-forwarded-for")
     if xff:
@@ -135,40 +413,36 @@ def register(
     else:
         client_ip = request.client.host if request.client else None
 
-    # 4) Kullanıcıyı oluştur
-    hashed_pw = get_password_hash(user_in.password)
+    # 4) Kullanıcıyı oluştur (bcrypt process havuzunda)
+    hashed_pw = await password_hasher.hash(user_in.password)
 
     user = User(
         email=user_in.email,
         hashed_password=hashed_pw,
-        plan="free",
+        plan=DEFAULT_PLAN,
         device_id=device_id,
         register_ip=client_ip,
     )
-    db.add(user)
-    db.commit()
-    db.refresh(user)
-
-    return user
+    return await run_in_threadpool(_create_user, db, user)
 
 
 @router.post("/login", response_model=Token)
-def login(
+async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db),
 ):
     # form_data.username -> email
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Yanlis email veya sifre.",
         )
 
-    access_token = create_access_token(data={"sub": user.email})
+    access_token = create_user_token(user)
     return Token(access_token=access_token, token_type="bearer")
 
 
 @router.get("/me", response_model=UserPublic)
-def read_me(current_user: User = Depends(get_current_user)):
+def read_me(current_user: CurrentUser = Depends(get_current_user)):
     return current_user
@@ -0,0 +1,351 @@
+# bench_api.py
+"""
+Uçtan uca yük / gecikme benchmark'ı (OpenAI'ye para ödemeden).
+
+api:app ayrı bir uvicorn process'inde, sahte LLM backend'iyle (LLM_BACKEND=fake)
+geçici bir klasörde açılır; oradaki caption.db'ye N sentetik kullanıcı yazılır.
+Sonra her endpoint verilen eşzamanlılık seviyelerinde sürülür.
+
+Kullanim:
+  python bench_api.py                                   # 200 kullanıcı, 1/8/32 eşzamanlılık
+  python bench_api.py --users 500 --concurrency 1,16,64 --requests 400
+  python bench_api.py --json sonuc.json
+  python bench_api.py --baseline onceki.json --max-regression 0.2   # %20'den kötüyse exit 1
+  # Gerçek HTTP yolu için mock sunucuya karşı:
+  LLM_BACKEND=compatible LLM_BASE_URL=http://127.0.0.1:8001/v1 python bench_api.py
+
+Rapor (endpoint x eşzamanlılık):
+  - throughput (istek/sn), hata sayısı, status kod dağılımı
+  - gecikme p50 / p95 / p99 / max (ms)
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+import httpx
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+ADMIN_SECRET = "bench-admin-secret"
+PASSWORD = "bench-password"
+ENDPOINTS = ["login", "me", "generate", "admin_metrics", "admin_users"]
+
+DESCRIPTION_WORDS = [
+    "yaz", "tatil", "plaj", "kahve", "sabah", "spor", "salon", "kedi", "köpek", "moda",
+    "kombin", "yemek", "tarif", "makyaj", "cilt", "bakım", "gezi", "istanbul", "doğa", "kamp",
+]
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# ------------------------------------------------------------
+# Hazırlık
+# ------------------------------------------------------------
+def seed_users(workdir: str, count: int, free_ratio: float) -> list:
+    """
+    workdir/caption.db'ye kullanıcıları toplu yazar. Şifre hash'i bir kez hesaplanır
+    (her kullanıcı için bcrypt çalıştırmak dakikalar sürerdi).
+    """
+    cwd = os.getcwd()
+    os.chdir(workdir)  # database.py caption.db'yi çalışma klasöründe açıyor
+    try:
+        sys.path.insert(0, REPO_DIR)
+        from database import Base, SessionLocal, engine
+        from models import User
+        from auth import get_password_hash
+
+        Base.metadata.create_all(bind=engine)
+        hashed = get_password_hash(PASSWORD)
+        rng = random.Random(7)
+        emails = [f"bench{i}@example.com" for i in range(count)]
+
+        db = SessionLocal()
+        try:
+            db.bulk_save_objects(
+                [
+                    User(
+                        email=email,
+                        hashed_password=hashed,
+                        plan="free" if rng.random() < free_ratio else "pro",
+                    )
+                    for email in emails
+                ]
+            )
+            db.commit()
+        finally:
+            db.close()
+        engine.dispose()
+        return emails
+    finally:
+        os.chdir(cwd)
+
+
+def start_server(workdir: str, port: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.setdefault("LLM_BACKEND", "fake")
+    env.setdefault("FAKE_LLM_SEED", "42")
+    env["ADMIN_SECRET"] = ADMIN_SECRET
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "api:app",
+            "--app-dir", REPO_DIR,
+            "--host", "127.0.0.1",
+            "--port", str(port),
+            "--log-level", "warning",
+        ],
+        cwd=workdir,
+        env=env,
+    )
+
+
+def wait_ready(base_url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("API process'i açılırken kapandı.")
+        try:
+            if httpx.get(base_url + "/", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("API zamanında ayağa kalkmadı.")
+
+
+# ------------------------------------------------------------
+# Yük
+# ------------------------------------------------------------
+class Scenario:
+    def __init__(self, emails: list, tokens: dict, unique_ratio: float, seed: int):
+        self.emails = emails
+        self.tokens = tokens
+        self.unique_ratio = unique_ratio
+        self.rng = random.Random(seed)
+        self.counter = 0
+
+    def description(self) -> str:
+        # unique_ratio kadarı hiç görülmemiş açıklama (cache MISS), kalanı tekrar (HIT)
+        self.counter += 1
+        if self.rng.random() < self.unique_ratio:
+            return " ".join(self.rng.sample(DESCRIPTION_WORDS, 5)) + f" {self.counter}"
+        return " ".join(DESCRIPTION_WORDS[:5])
+
+    def request(self, endpoint: str) -> dict:
+        email = self.rng.choice(self.emails)
+        auth = {"Authorization": "Bearer " + self.tokens.get(email, "")}
+        admin = {"x-admin-secret": ADMIN_SECRET}
+
+        if endpoint == "login":
+            return {"method": "POST", "url": "/auth/login", "data": {"username": email, "password": PASSWORD}}
+        if endpoint == "me":
+            return {"method": "GET", "url": "/auth/me", "headers": auth}
+        if endpoint == "generate":
+            return {
+                "method": "POST",
+                "url": "/generate",
+                "headers": auth,
+                "json": {"niche": "bench", "description": self.description()},
+            }
+        if endpoint == "admin_metrics":
+            return {"method": "GET", "url": "/admin/metrics", "headers": admin}
+        if endpoint == "admin_users":
+            return {"method": "GET", "url": "/admin/users", "headers": admin, "params": {"limit": 50}}
+        raise ValueError(endpoint)
+
+
+async def run_level(client: httpx.AsyncClient, scenario: Scenario, endpoint: str, concurrency: int, total: int) -> dict:
+    latencies = []
+    statuses: dict = {}
+    remaining = total
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            spec = scenario.request(endpoint)
+            started = time.perf_counter()
+            try:
+                response = await client.request(**spec)
+                status = str(response.status_code)
+            except httpx.HTTPError as exc:
+                status = type(exc).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    return {
+        "requests": total,
+        "errors": total - ok,
+        "statuses": statuses,
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2),
+    }
+
+
+async def login_all(client: httpx.AsyncClient, emails: list, concurrency: int) -> dict:
+    tokens = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(email: str):
+        async with semaphore:
+            response = await client.post("/auth/login", data={"username": email, "password": PASSWORD})
+            response.raise_for_status()
+            tokens[email] = response.json()["access_token"]
+
+    await asyncio.gather(*(one(email) for email in emails))
+    return tokens
+
+
+async def run_benchmark(base_url: str, emails: list, args) -> dict:
+    limits = httpx.Limits(max_connections=max(args.concurrency) * 2, max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        print(f"{len(emails)} kullanıcı için token alınıyor...")
+        tokens = await login_all(client, emails, max(args.concurrency))
+        scenario = Scenario(emails, tokens, args.unique_ratio, args.seed)
+
+        results = {}
+        for endpoint in args.endpoints:
+            results[endpoint] = {}
+            for concurrency in args.concurrency:
+                # Isınma (bağlantı havuzu, cache'ler)
+                await run_level(client, scenario, endpoint, concurrency, min(concurrency * 2, args.requests))
+                level = await run_level(client, scenario, endpoint, concurrency, args.requests)
+                results[endpoint][f"c{concurrency}"] = level
+                print(
+                    f"  {endpoint:<14} c={concurrency:<4} {level['rps']:>8} rps  "
+                    f"p50 {level['p50_ms']:>8} ms  p95 {level['p95_ms']:>8} ms  "
+                    f"p99 {level['p99_ms']:>8} ms  hata {level['errors']}"
+                )
+
+        server_metrics = (await client.get("/admin/metrics", headers={"x-admin-secret": ADMIN_SECRET})).json()
+
+    token_cache = server_metrics.get("auth_token_cache")
+    if token_cache:
+        print(
+            f"  auth token cache: hit oranı {token_cache['hit_rate']}, "
+            f"hit {token_cache['hit_us_avg']} µs / miss {token_cache['miss_us_avg']} µs "
+            f"(hit başına {token_cache['saved_us_per_hit']} µs kazanç)"
+        )
+    return {"results": results, "server_metrics": server_metrics}
+
+
+# ------------------------------------------------------------
+# Karşılaştırma
+# ------------------------------------------------------------
+def compare(current: dict, baseline: dict, max_regression: float) -> list:
+    """
+    Baseline'a göre p95'i max_regression'dan fazla artan ya da throughput'u o kadar düşen
+    (endpoint, seviye) çiftlerini döner.
+    """
+    regressions = []
+    for endpoint, levels in current["results"].items():
+        for level, now in levels.items():
+            before = baseline.get("results", {}).get(endpoint, {}).get(level)
+            if not before:
+                continue
+            if before["p95_ms"] and now["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+                regressions.append(f"{endpoint} {level}: p95 {before['p95_ms']} -> {now['p95_ms']} ms")
+            if before["rps"] and now["rps"] < before["rps"] * (1 - max_regression):
+                regressions.append(f"{endpoint} {level}: rps {before['rps']} -> {now['rps']}")
+            if now["errors"] > before["errors"] + now["requests"] * max_regression:
+                regressions.append(f"{endpoint} {level}: hata {before['errors']} -> {now['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API uçtan uca benchmark")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--free-ratio", type=float, default=0.0, help="free plan kullanıcı oranı (günlük limite takılır)")
+    parser.add_argument("--concurrency", default="1,8,32", help="virgülle ayrılmış seviyeler")
+    parser.add_argument("--requests", type=int, default=200, help="her endpoint x seviye için istek sayısı")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--unique-ratio", type=float, default=1.0, help="/generate'te yeni açıklama oranı")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", help="caption.db vb. buraya yazılır (varsayılan: geçici klasör)")
+    parser.add_argument("--json", help="sonucu bu dosyaya JSON olarak yaz")
+    parser.add_argument("--baseline", help="karşılaştırılacak önceki JSON sonucu")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c]
+    args.endpoints = [e for e in args.endpoints.split(",") if e]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"bilinmeyen endpoint: {', '.join(sorted(unknown))}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="caption-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    if os.path.exists(os.path.join(workdir, "caption.db")):
+        parser.error(f"{workdir} içinde caption.db zaten var; boş bir klasör ver.")
+
+    print(f"Çalışma klasörü: {workdir}")
+    emails = seed_users(workdir, args.users, args.free_ratio)
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = start_server(workdir, port)
+    try:
+        wait_ready(base_url, process)
+        run = asyncio.run(run_benchmark(base_url, emails, args))
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "users": args.users,
+            "free_ratio": args.free_ratio,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "unique_ratio": args.unique_ratio,
+            "llm_backend": os.getenv("LLM_BACKEND", "fake"),
+        },
+        **run,
+    }
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Sonuç yazıldı: {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.max_regression)
+        if regressions:
+            print("Gerileme bulundu:")
+            for line in regressions:
+                print("  - " + line)
+            return 1
+        print(f"Baseline'a göre %{int(args.max_regression * 100)}'den büyük gerileme yok.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
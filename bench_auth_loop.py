@@ -0,0 +1,170 @@
+# bench_auth_loop.py
+"""
+get_current_user'ın event loop'u istek başına ne kadar blokladığını ölçer.
+
+Aynı token'larla üç yol karşılaştırılır:
+  - sync_db:    eski hali; jwt.decode + senkron db.query(User) doğrudan loop üzerinde
+  - threadpool: şu anki get_current_user, token cache kapalı, sürüm her istekte DB'den
+                (DB işi threadpool'da)
+  - cached:     şu anki get_current_user, varsayılan ayarlar (token cache + sürüm TTL)
+
+Ölçüm:
+  - loop'un çalıştırdığı her callback'in süresi (asyncio Handle._run sarmalanarak)
+    -> istek başına loop'ta geçen süre ve en uzun tek blok
+  - 1 ms'lik nabız görevinin gecikmesi (p50 / p99): loop bloklandıkça diğer
+    istekler bu kadar bekler
+
+Kullanim:
+  python bench_auth_loop.py
+  python bench_auth_loop.py --users 200 --requests 4000 --concurrency 32
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+MODES = ["sync_db", "threadpool", "cached"]
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+class LoopTimer:
+    """
+    asyncio.Handle._run'ı sararak loop üzerinde geçen her adımın süresini toplar.
+    """
+
+    def __init__(self):
+        self.busy_seconds = 0.0
+        self.max_block = 0.0
+        self._original = None
+
+    def __enter__(self):
+        timer = self
+        original = self._original = asyncio.events.Handle._run
+
+        def timed_run(handle):
+            started = time.perf_counter()
+            try:
+                return original(handle)
+            finally:
+                elapsed = time.perf_counter() - started
+                timer.busy_seconds += elapsed
+                if elapsed > timer.max_block:
+                    timer.max_block = elapsed
+
+        asyncio.events.Handle._run = timed_run
+        return self
+
+    def __exit__(self, *exc):
+        asyncio.events.Handle._run = self._original
+
+
+async def heartbeat(lags: list, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(max(0.0, time.perf_counter() - started - 0.001))
+
+
+async def run_mode(mode: str, tokens: list, concurrency: int, total: int) -> dict:
+    import auth
+    from database import SessionLocal
+
+    async def sync_db(token: str):
+        # Değişiklik öncesi get_current_user'ın yaptığı iş (loop üzerinde senkron sorgu)
+        payload = auth.jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+        db = SessionLocal()
+        try:
+            return auth.get_user_by_email(db, payload["sub"])
+        finally:
+            db.close()
+
+    default_cache, default_ttl = auth.token_cache, auth.TOKEN_VERSION_TTL
+    auth._token_versions.clear()
+    if mode == "threadpool":
+        auth.token_cache, auth.TOKEN_VERSION_TTL = None, 0.0
+    elif mode == "cached":
+        auth.token_cache = auth.TokenCache(auth.TOKEN_CACHE_MAX_ENTRIES)
+    call = sync_db if mode == "sync_db" else auth.get_current_user
+
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            await call(tokens[i % len(tokens)])
+            # Gerçek sunucuda istekler arası loop'a dönülür (socket okuma / yazma)
+            await asyncio.sleep(0)
+
+    lags: list = []
+    stop = asyncio.Event()
+    try:
+        with LoopTimer() as timer:
+            beat = asyncio.ensure_future(heartbeat(lags, stop))
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await beat
+    finally:
+        auth.token_cache, auth.TOKEN_VERSION_TTL = default_cache, default_ttl
+
+    return {
+        "rps": round(total / elapsed, 1),
+        "loop_us_per_request": round(timer.busy_seconds / total * 1e6, 1),
+        "max_block_ms": round(timer.max_block * 1000, 2),
+        "lag_ms_p50": round(percentile(lags, 0.50) * 1000, 2),
+        "lag_ms_p99": round(percentile(lags, 0.99) * 1000, 2),
+    }
+
+
+def seed(count: int) -> list:
+    from database import Base, SessionLocal, engine
+    from models import User
+    import auth
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        db.bulk_save_objects(
+            [User(email=f"bench{i}@example.com", hashed_password="x", plan="pro") for i in range(count)]
+        )
+        db.commit()
+        return [auth.create_user_token(user) for user in db.query(User).all()]
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Auth dependency event loop blok ölçümü")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="caption-auth-bench-")
+    os.chdir(workdir)  # database.py caption.db'yi çalışma klasöründe açıyor
+    sys.path.insert(0, REPO_DIR)
+    print(f"Çalışma klasörü: {workdir}")
+
+    tokens = seed(args.users)
+    for mode in MODES:
+        # Isınma (threadpool, SQLAlchemy bağlantı havuzu)
+        asyncio.run(run_mode(mode, tokens, args.concurrency, min(200, args.requests)))
+        result = asyncio.run(run_mode(mode, tokens, args.concurrency, args.requests))
+        print(
+            f"  {mode:<11} {result['rps']:>9} rps  loop {result['loop_us_per_request']:>8} µs/istek  "
+            f"en uzun blok {result['max_block_ms']:>7} ms  "
+            f"nabız gecikmesi p50 {result['lag_ms_p50']:>6} ms  p99 {result['lag_ms_p99']:>6} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# bench_semantic_cache.py
+"""
+Semantik cache benchmark'ı (ağ / OpenAI yok).
+
+Kullanim:
+  python bench_semantic_cache.py                       # 1M kayit, 20k sorgu
+  python bench_semantic_cache.py --entries 100000 --queries 5000 --threshold 0.75
+  python bench_semantic_cache.py --json sonuc.json
+
+Rapor:
+  - yakın kopya sorgularda hit rate (emoji / ek / tek kelime farkı)
+  - alakasız sorgularda yanlış hit oranı
+  - lookup gecikmesi p50 / p95 / p99 (µs)
+  - doldurma süresi ve process'in tepe belleği
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+
+os.environ.setdefault("OPENAI_API_KEY", "bench-not-used")
+
+from semantic_cache import SemanticCache  # noqa: E402
+
+SYLLABLES = [
+    "ye", "ni", "se", "zon", "ür", "ün", "ler", "gel", "di", "kam", "pan", "ya",
+    "baş", "la", "dı", "ta", "nı", "tım", "gün", "bu", "çok", "gü", "zel", "ka",
+    "hve", "sa", "bah", "yaz", "kış", "in", "di", "rim", "fır", "sat", "spor", "yol",
+    "ev", "iş", "ma", "kar", "mo", "da", "ko", "lek", "si", "yon", "ta", "til",
+]
+EMOJIS = ["🔥", "✨", "😍", "💯", "🎉", "👀"]
+SUFFIXES = ["ler", "lar", "de", "da", "i", "ı", "yi", "yı", "nin"]
+
+
+def make_vocab(rng: random.Random, size: int) -> list:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def make_description(rng: random.Random, vocab: list) -> str:
+    return " ".join(rng.choice(vocab) for _ in range(rng.randint(5, 9)))
+
+
+def perturb(rng: random.Random, text: str) -> str:
+    """
+    Gerçek hayattaki küçük farklar: emoji eklemek, bir ek, büyük harf.
+    """
+    words = text.split()
+    kind = rng.randrange(4)
+    if kind == 0:
+        return text + " " + rng.choice(EMOJIS)
+    if kind == 1:
+        i = rng.randrange(len(words))
+        words[i] = words[i] + rng.choice(SUFFIXES)
+    elif kind == 2:
+        i = rng.randrange(len(words))
+        words[i] = words[i][:-1] or words[i]
+    else:
+        words[0] = words[0].upper()
+    return " ".join(words)
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Semantik cache benchmark")
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=20_000)
+    parser.add_argument("--niches", type=int, default=50)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="sonucu bu dosyaya JSON olarak yaz")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocab = make_vocab(rng, 5000)
+    niches = [f"nis {i}" for i in range(args.niches)]
+    result = "Captions:\n1: ...\n2: ...\n3: ...\n\nHashtags:\n#captiongenerator"
+
+    cache = SemanticCache(
+        threshold=args.threshold,
+        max_entries=args.entries,
+        max_bytes=args.entries * 256,
+    )
+
+    # ---------- doldur ----------
+    print(f"{args.entries} kayit ekleniyor...")
+    samples = []
+    sample_every = max(1, args.entries // args.queries)
+    started = time.perf_counter()
+    for i in range(args.entries):
+        niche = niches[i % len(niches)]
+        description = make_description(rng, vocab)
+        cache.add(niche, description, result)
+        if i % sample_every == 0:
+            samples.append((niche, description))
+        if i and i % 100_000 == 0:
+            print(f"  {i} kayit ({time.perf_counter() - started:.0f} s)")
+    fill_seconds = time.perf_counter() - started
+
+    # ---------- sorgula ----------
+    near_hits = fresh_hits = 0
+    near_total = fresh_total = 0
+    latencies = []
+
+    for i in range(args.queries):
+        if i % 2 == 0:
+            niche, description = rng.choice(samples)
+            description = perturb(rng, description)
+            near = True
+        else:
+            niche, description = rng.choice(niches), make_description(rng, vocab)
+            near = False
+
+        t0 = time.perf_counter()
+        hit = cache.get(niche, description) is not None
+        latencies.append((time.perf_counter() - t0) * 1e6)
+
+        if near:
+            near_total += 1
+            near_hits += hit
+        else:
+            fresh_total += 1
+            fresh_hits += hit
+
+    report = {
+        "entries": len(cache),
+        "queries": args.queries,
+        "threshold": args.threshold,
+        "fill_seconds": round(fill_seconds, 1),
+        "add_us_avg": round(fill_seconds / args.entries * 1e6, 1),
+        "near_duplicate_hit_rate": round(near_hits / near_total, 4) if near_total else 0.0,
+        "unrelated_false_hit_rate": round(fresh_hits / fresh_total, 4) if fresh_total else 0.0,
+        "lookup_us_p50": round(percentile(latencies, 50), 1),
+        "lookup_us_p95": round(percentile(latencies, 95), 1),
+        "lookup_us_p99": round(percentile(latencies, 99), 1),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
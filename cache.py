@@ -0,0 +1,136 @@
+# cache.py
+import os
+import time
+import hashlib
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+from llm import MODEL
+from prompts import SYSTEM_PROMPT
+
+# ------------------------------------------------------------
+# Cache ayarları (.env ile değiştirilebilir)
+# ------------------------------------------------------------
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") == "1"
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "5000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", str(60 * 60 * 24)))
+
+# Prompt (veya model) değişince eski kayıtlar kendiliğinden geçersiz olur
+PROMPT_VERSION = hashlib.sha256(f"{MODEL}\n{SYSTEM_PROMPT}".encode("utf-8")).hexdigest()[:12]
+
+
+# ------------------------------------------------------------
+# Key helpers
+# ------------------------------------------------------------
+_TR_LOWER = str.maketrans({"I": "ı", "İ": "i"})
+
+
+def normalize_text(text: str) -> str:
+    """
+    Türkçe'ye uygun normalizasyon:
+    - NFC (ayrık yazılmış şapka/nokta birleşir)
+    - I -> ı, İ -> i, sonra lower()
+    - baştaki/sondaki boşluklar atılır, aradaki boşluklar teke iner
+    """
+    text = unicodedata.normalize("NFC", text or "")
+    text = text.translate(_TR_LOWER).lower()
+    return " ".join(text.split())
+
+
+def make_key(niche: str, description: str) -> str:
+    raw = "\x1f".join([PROMPT_VERSION, normalize_text(niche), normalize_text(description)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ------------------------------------------------------------
+# L1: process içi LRU + TTL cache
+# ------------------------------------------------------------
+class ResultCache:
+    """
+    Sınırlı boyutlu LRU + TTL cache.
+    - max_entries: kayıt sayısı üst sınırı
+    - max_bytes: key + value (utf-8) toplam boyut üst sınırı
+    - ttl_seconds: kaydın yaşam süresi
+    Sadece event loop içinden kullanılıyor, kilit gerekmez.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, size, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        size = len(key) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        if key in self._data:
+            self._remove(key)
+
+        self._data[key] = (value, size, time.monotonic() + self.ttl_seconds)
+        self._bytes += size
+
+        while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._bytes = 0
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+result_cache = ResultCache(
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_BYTES,
+    ttl_seconds=CACHE_TTL_SECONDS,
+)
@@ -0,0 +1,257 @@
+# disk_cache.py
+import os
+import sys
+import time
+import zlib
+import sqlite3
+import threading
+from typing import Optional
+
+# ------------------------------------------------------------
+# L2 cache ayarları (.env ile değiştirilebilir)
+# ------------------------------------------------------------
+L2_CACHE_ENABLED = os.getenv("L2_CACHE_ENABLED", "1") == "1"
+L2_CACHE_PATH = os.getenv("L2_CACHE_PATH", "./generation_cache.db")
+L2_CACHE_MAX_BYTES = int(os.getenv("L2_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+L2_CACHE_TTL_SECONDS = int(os.getenv("L2_CACHE_TTL_SECONDS", str(60 * 60 * 24 * 7)))
+
+# Eviction limiti aşınca boyutu bu orana kadar düşür (her set'te evict etmemek için)
+_LOW_WATER = 0.9
+# Okumalarda accessed_at'i en fazla bu sıklıkla güncelle (yazma trafiğini azaltır)
+_TOUCH_INTERVAL = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed_at ON cache_entries (accessed_at);
+CREATE INDEX IF NOT EXISTS ix_cache_entries_expires_at ON cache_entries (expires_at);
+
+CREATE TABLE IF NOT EXISTS cache_meta (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    total_bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_meta (id, total_bytes) VALUES (1, 0);
+
+-- Toplam boyut trigger'larla tutuluyor -> her process aynı sayıyı görür
+CREATE TRIGGER IF NOT EXISTS cache_entries_ai AFTER INSERT ON cache_entries BEGIN
+    UPDATE cache_meta SET total_bytes = total_bytes + NEW.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_entries_ad AFTER DELETE ON cache_entries BEGIN
+    UPDATE cache_meta SET total_bytes = total_bytes - OLD.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_entries_au AFTER UPDATE OF size ON cache_entries BEGIN
+    UPDATE cache_meta SET total_bytes = total_bytes - OLD.size + NEW.size WHERE id = 1;
+END;
+"""
+
+
+class DiskCache:
+    """
+    SQLite dosyası üzerinde, process'ler arası paylaşılan key/value cache.
+    - value'lar zlib ile sıkıştırılır
+    - TTL dolan kayıtlar okunmaz, compact() ile silinir
+    - toplam boyut max_bytes'ı aşınca en az kullanılanlar silinir
+    - WAL modu + busy_timeout: birden çok uvicorn worker'ı aynı dosyayı güvenle kullanır
+    Metodlar bloklayıcıdır; async koddan threadpool ile çağrılmalı.
+    """
+
+    def __init__(self, path: str, max_bytes: int, ttl_seconds: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.evictions = 0
+        self.errors = 0
+
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+
+    # ---------- bağlantı (thread başına bir tane) ----------
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def _file_bytes(self) -> int:
+        # WAL dosyası da diskte yer kaplıyor
+        total = os.path.getsize(self.path)
+        wal = self.path + "-wal"
+        if os.path.exists(wal):
+            total += os.path.getsize(wal)
+        return total
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    # ---------- okuma / yazma ----------
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT value, expires_at, accessed_at FROM cache_entries WHERE key = ?",
+                (key,),
+            ).fetchone()
+
+            if row is None or row[1] <= now:
+                self._count("misses")
+                return None
+
+            if now - row[2] > _TOUCH_INTERVAL:
+                conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key))
+
+            value = zlib.decompress(row[0]).decode("utf-8")
+        except (sqlite3.Error, zlib.error):
+            # Cache hatası üretimi durdurmasın -> miss say
+            self._count("errors")
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        blob = zlib.compress(value.encode("utf-8"), 6)
+        size = len(key) + len(blob)
+        if size > self.max_bytes:
+            return
+
+        try:
+            conn = self._conn()
+            conn.execute(
+                """
+                INSERT INTO cache_entries (key, value, size, expires_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    value = excluded.value,
+                    size = excluded.size,
+                    expires_at = excluded.expires_at,
+                    accessed_at = excluded.accessed_at
+                """,
+                (key, blob, size, now + self.ttl_seconds, now),
+            )
+            self._count("sets")
+
+            total = conn.execute("SELECT total_bytes FROM cache_meta WHERE id = 1").fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(conn, int(self.max_bytes * _LOW_WATER))
+        except sqlite3.Error:
+            self._count("errors")
+
+    def _evict(self, conn: sqlite3.Connection, target_bytes: int) -> int:
+        """
+        Önce süresi dolanları, sonra en az kullanılanları siler.
+        """
+        removed = conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),)).rowcount
+
+        while True:
+            total = conn.execute("SELECT total_bytes FROM cache_meta WHERE id = 1").fetchone()[0]
+            if total <= target_bytes:
+                break
+            deleted = conn.execute(
+                """
+                DELETE FROM cache_entries WHERE key IN (
+                    SELECT key FROM cache_entries ORDER BY accessed_at LIMIT 32
+                )
+                """
+            ).rowcount
+            if not deleted:
+                break
+            removed += deleted
+
+        self._count("evictions", removed)
+        return removed
+
+    # ---------- bakım ----------
+    def compact(self) -> dict:
+        """
+        Offline bakım: süresi dolanları ve limit fazlasını siler, dosyayı VACUUM'lar.
+        """
+        conn = self._conn()
+        size_before = self._file_bytes()
+        removed = self._evict(conn, self.max_bytes)
+        conn.execute("VACUUM")
+        # VACUUM WAL'a yazar; asıl dosyaya aktarıp WAL'ı sıfırla
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {
+            "removed": removed,
+            "file_bytes_before": size_before,
+            "file_bytes_after": self._file_bytes(),
+        }
+
+    def stats(self) -> dict:
+        try:
+            conn = self._conn()
+            entries = conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+            total = conn.execute("SELECT total_bytes FROM cache_meta WHERE id = 1").fetchone()[0]
+            file_bytes = self._file_bytes()
+        except (sqlite3.Error, OSError):
+            entries = total = file_bytes = None
+
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": entries,
+            "bytes": total,
+            "file_bytes": file_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            # Aşağıdakiler bu process'e ait sayaçlar
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "sets": self.sets,
+            "evictions": self.evictions,
+            "errors": self.errors,
+        }
+
+
+disk_cache = (
+    DiskCache(L2_CACHE_PATH, max_bytes=L2_CACHE_MAX_BYTES, ttl_seconds=L2_CACHE_TTL_SECONDS)
+    if L2_CACHE_ENABLED
+    else None
+)
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("compact", "stats"):
+        print("Kullanim:")
+        print("  python disk_cache.py compact   # suresi dolanlari sil, VACUUM")
+        print("  python disk_cache.py stats     # kayit sayisi / boyut")
+        sys.exit(1)
+
+    cache = disk_cache or DiskCache(
+        L2_CACHE_PATH, max_bytes=L2_CACHE_MAX_BYTES, ttl_seconds=L2_CACHE_TTL_SECONDS
+    )
+
+    if sys.argv[1] == "compact":
+        result = cache.compact()
+        print(
+            f"[OK] {result['removed']} kayit silindi, dosya "
+            f"{result['file_bytes_before']} -> {result['file_bytes_after']} byte"
+        )
+    else:
+        stats = cache.stats()
+        print(f"[OK] {stats['entries']} kayit, {stats['bytes']} byte (dosya: {stats['file_bytes']} byte)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# fake_llm.py
+import os
+import re
+import random
+import asyncio
+import hashlib
+from typing import Optional
+
+import httpx
+import openai
+
+from ratelimit import estimate_prompt_tokens
+
+# ------------------------------------------------------------
+# Sahte LLM ayarları (.env ile değiştirilebilir) -> LLM_BACKEND=fake
+# Token ödemeden / ağ olmadan yük testi ve benchmark için.
+# ------------------------------------------------------------
+# İlk token süresi lognormal: medyan FAKE_LLM_TTFT_MS, yayılım FAKE_LLM_LATENCY_SIGMA
+FAKE_LLM_TTFT_MS = float(os.getenv("FAKE_LLM_TTFT_MS", "300"))
+FAKE_LLM_LATENCY_SIGMA = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.5"))
+# Token'lar bu hızda akar (complete çağrısında da toplam süreye eklenir)
+FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "80"))
+# Hata oranları (0-1): 5xx ve 429
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_LLM_RATE_LIMIT_RATE = float(os.getenv("FAKE_LLM_RATE_LIMIT_RATE", "0"))
+# Gecikme / hata zarları için seed (boşsa rastgele); metin her zaman girdiden deterministik
+FAKE_LLM_SEED = os.getenv("FAKE_LLM_SEED")
+
+_EMOJIS = ["✨", "🔥", "💫", "😍", "🌸", "📸", "💯", "🙌"]
+_OPENERS = ["Bugün", "Sonunda", "İşte", "Hazır mısın?", "Kaydet ve paylaş:"]
+_CLOSERS = ["Sen ne düşünüyorsun?", "Yorumlara yaz 👇", "Bir sonraki için takipte kal.", "Kaydetmeyi unutma!"]
+_GENERIC_TAGS = ["kesfet", "instagood", "reels", "trend", "gununfotografi", "turkiye", "explore", "viral"]
+_FAKE_URL = "http://fake-llm.local/v1/chat/completions"
+
+
+def user_text(messages: list) -> tuple:
+    """
+    build_messages() çıktısından (niş, açıklama) ayıklar.
+    """
+    content = messages[-1].get("content") or ""
+    niche = re.search(r"Nis:[ \t]*(.*)", content)
+    description = re.search(r'"""(.*?)"""', content, re.S)
+    return (
+        niche.group(1).strip() if niche else "",
+        description.group(1).strip() if description else content.strip(),
+    )
+
+
+def _slug(word: str) -> str:
+    return re.sub(r"\W+", "", word.lower())
+
+
+def fake_captions(niche: str, description: str) -> str:
+    """
+    Gerçek cevap formatında (Captions: / Hashtags:) metin. Aynı girdi -> aynı metin.
+    """
+    seed = int.from_bytes(hashlib.blake2b(f"{niche}\n{description}".encode("utf-8"), digest_size=8).digest(), "big")
+    rng = random.Random(seed)
+
+    words = [w for w in re.findall(r"\w+", description) if len(w) > 2] or ["icerik"]
+    topic = " ".join(words[:6])
+
+    captions = []
+    for i in range(3):
+        captions.append(
+            f"{i + 1}: {rng.choice(_OPENERS)} {topic} {rng.choice(_EMOJIS)} {rng.choice(_CLOSERS)}"
+        )
+
+    tags = []
+    for word in [niche] + words + _GENERIC_TAGS:
+        tag = _slug(word)
+        if tag and tag not in tags:
+            tags.append(tag)
+    tags = tags[: rng.randint(10, 14)] + ["captiongenerator"]
+
+    return "Captions:\n" + "\n".join(captions) + "\n\nHashtags:\n" + " ".join("#" + t for t in tags)
+
+
+def split_tokens(text: str) -> list:
+    # ~4 karakterlik parçalar; stream'de gerçek token akışına benzesin
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+class _FakeStream:
+    def __init__(self, tokens: list, usage: dict):
+        self._tokens = tokens
+        self._usage = usage
+        self._index = 0
+        self._done = False
+
+    async def next(self) -> Optional[tuple]:
+        if self._done:
+            return None
+        await asyncio.sleep(1.0 / FAKE_LLM_TOKENS_PER_SECOND)
+
+        if self._index < len(self._tokens):
+            token = self._tokens[self._index]
+            self._index += 1
+            return token, None
+
+        self._done = True
+        return "", self._usage
+
+    async def close(self) -> None:
+        self._done = True
+
+
+class FakeBackend:
+    """
+    Süreç içi sahte upstream. Gecikme dağılımı, token sayıları ve hata oranları ayarlanabilir.
+    Hatalar gerçek OpenAI exception tipleriyle fırlatılır -> retry / breaker gerçekten çalışır.
+    """
+
+    name = "fake"
+
+    def __init__(self):
+        self.rng = random.Random(int(FAKE_LLM_SEED)) if FAKE_LLM_SEED else random.Random()
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.tokens = 0
+
+    def _ttft(self) -> float:
+        return FAKE_LLM_TTFT_MS / 1000.0 * self.rng.lognormvariate(0, FAKE_LLM_LATENCY_SIGMA)
+
+    def _maybe_fail(self) -> None:
+        self.requests += 1
+        roll = self.rng.random()
+        request = httpx.Request("POST", _FAKE_URL)
+        if roll < FAKE_LLM_RATE_LIMIT_RATE:
+            self.rate_limited += 1
+            raise openai.RateLimitError(
+                "fake rate limit",
+                response=httpx.Response(429, request=request, headers={"retry-after": "1"}),
+                body=None,
+            )
+        if roll < FAKE_LLM_RATE_LIMIT_RATE + FAKE_LLM_ERROR_RATE:
+            self.errors += 1
+            raise openai.InternalServerError(
+                "fake upstream error",
+                response=httpx.Response(500, request=request),
+                body=None,
+            )
+
+    def _prepare(self, messages: list) -> tuple:
+        niche, description = user_text(messages)
+        text = fake_captions(niche, description)
+        prompt_tokens = estimate_prompt_tokens(messages)
+        completion_tokens = max(1, len(text) // 4)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        self.tokens += usage["total_tokens"]
+        return text, usage
+
+    async def complete(self, messages: list, estimated_tokens: int) -> str:
+        # Gerçekteki gibi hata da ancak bir süre sonra gelir
+        await asyncio.sleep(self._ttft())
+        self._maybe_fail()
+        text, usage = self._prepare(messages)
+        await asyncio.sleep(usage["completion_tokens"] / FAKE_LLM_TOKENS_PER_SECOND)
+        return text
+
+    async def open_stream(self, messages: list, estimated_tokens: int) -> _FakeStream:
+        await asyncio.sleep(self._ttft())
+        self._maybe_fail()
+        text, usage = self._prepare(messages)
+        return _FakeStream(split_tokens(text), usage)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "requests": self.requests,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "tokens": self.tokens,
+            "ttft_ms_median": FAKE_LLM_TTFT_MS,
+            "latency_sigma": FAKE_LLM_LATENCY_SIGMA,
+            "tokens_per_second": FAKE_LLM_TOKENS_PER_SECOND,
+            "error_rate": FAKE_LLM_ERROR_RATE,
+            "rate_limit_rate": FAKE_LLM_RATE_LIMIT_RATE,
+        }
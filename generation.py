@@ -0,0 +1,148 @@
+# generation.py
+from typing import Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+import llm
+from cache import CACHE_ENABLED, make_key, result_cache
+from disk_cache import disk_cache
+from semantic_cache import semantic_cache
+from singleflight import flights
+from scheduler import scheduler
+
+
+# ------------------------------------------------------------
+# Cache önündeki üretim katmanı -> api.py burayı kullanıyor
+# L1: process içi LRU (cache.py), L2: worker'lar arası SQLite (disk_cache.py),
+# opsiyonel semantik: yakın kopya açıklamalar (semantic_cache.py)
+# ------------------------------------------------------------
+async def lookup(description: str, niche: str = "") -> Optional[str]:
+    """
+    Aynı (niş, açıklama, prompt versiyonu) için daha önce üretilmiş sonucu döner.
+    L2'de veya semantik cache'te bulunan sonuç L1'e de yazılır.
+    """
+    key = make_key(niche, description)
+
+    if CACHE_ENABLED:
+        cached = result_cache.get(key)
+        if cached is not None:
+            return cached
+
+    if disk_cache is not None:
+        cached = await run_in_threadpool(disk_cache.get, key)
+        if cached is not None:
+            if CACHE_ENABLED:
+                result_cache.set(key, cached)
+            return cached
+
+    if semantic_cache is not None:
+        cached = semantic_cache.get(niche, description)
+        if cached is not None:
+            if CACHE_ENABLED:
+                result_cache.set(key, cached)
+            return cached
+
+    return None
+
+
+async def remember(description: str, niche: str, result: str) -> None:
+    if not result:
+        return
+
+    key = make_key(niche, description)
+    if CACHE_ENABLED:
+        result_cache.set(key, result)
+    if semantic_cache is not None:
+        semantic_cache.add(niche, description, result)
+    if disk_cache is not None:
+        await run_in_threadpool(disk_cache.set, key, result)
+
+
+async def generate(
+    description: str,
+    niche: str = "",
+    fresh: bool = False,
+    user_id: int = 0,
+    plan: str = "free",
+) -> Tuple[str, bool]:
+    """
+    Cache'e bakar, yoksa LLM'den üretir ve cache'e yazar.
+    fresh=True ise (Cache-Control: no-cache) cache okunmaz ama sonuç yine yazılır.
+    Aynı key için uçuşta bir üretim varsa yeni upstream çağrısı yapılmaz, onun sonucu beklenir
+    (fresh hariç: kullanıcı başkası için üretilmiş sonucu değil yeni bir varyasyon istiyor).
+    Upstream çağrısı scheduler'dan (plan / kullanıcı) sıra alarak yapılır.
+    (sonuç, cache'ten_mi_geldi) döner.
+    """
+    if not fresh:
+        cached = await lookup(description, niche)
+        if cached is not None:
+            return cached, True
+
+    async def produce() -> str:
+        async with scheduler.slot(user_id, plan):
+            result = await llm.generate_captions_and_hashtags(description=description, niche=niche)
+        await remember(description, niche, result)
+        return result
+
+    if fresh:
+        return await produce(), False
+
+    result = await flights.do(make_key(niche, description), produce)
+    return result, False
+
+
+async def stream(
+    description: str,
+    niche: str = "",
+    fresh: bool = False,
+    user_id: int = 0,
+    plan: str = "free",
+):
+    """
+    generate() ile aynı katmanlar, ama token'lar geldikçe verilir.
+    (event, data) çiftleri döner:
+    - ("delta", {"text": "..."})
+    - ("done", {"result": "...", "usage": {...} | None, "cached": bool})
+    Cache veya uçuştaki aynı üretimden gelen sonuçta delta olmaz, direkt done gelir.
+    fresh=True ise uçuştaki üretime katılmaz, kendi üretimini de paylaşmaz.
+    """
+    if not fresh:
+        cached = await lookup(description, niche)
+        if cached is not None:
+            yield "done", {"result": cached, "usage": None, "cached": True}
+            return
+
+    key = make_key(niche, description)
+    future = None
+    if not fresh:
+        shared = await flights.follow(key)
+        if shared is not None:
+            yield "done", {"result": shared, "usage": None, "cached": False}
+            return
+
+        # Leader: token'ları akıtırken aynı key'e gelenler sonucu bekler
+        future = flights.lead(key)
+    parts = []
+    usage = None
+    try:
+        async with scheduler.slot(user_id, plan):
+            async for delta, chunk_usage in llm.stream_captions_and_hashtags(
+                description=description,
+                niche=niche,
+            ):
+                if delta:
+                    parts.append(delta)
+                    yield "delta", {"text": delta}
+                if chunk_usage:
+                    usage = chunk_usage
+
+        result = "".join(parts).strip()
+        await remember(description, niche, result)
+    except BaseException as exc:
+        if future is not None:
+            flights.finish(key, future, error=exc)
+        raise
+
+    if future is not None:
+        flights.finish(key, future, result=result)
+    yield "done", {"result": result, "usage": usage, "cached": False}
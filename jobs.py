@@ -0,0 +1,408 @@
+# jobs.py
+import os
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+import anyio
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import generation
+import quota
+from database import SessionLocal
+from models import GenerationJob, User
+from plans import DEFAULT_PLAN
+from scheduler import Overloaded
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------
+# İş kuyruğu ayarları (.env ile değiştirilebilir)
+# ------------------------------------------------------------
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# LLM timeout'undan uzun olmalı; süre dolan "running" iş başka worker'a geçer
+JOB_VISIBILITY_TIMEOUT = int(os.getenv("JOB_VISIBILITY_TIMEOUT", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+# Üretim sürerken kira bu aralıkla uzatılır (scheduler sırası + retry'lar timeout'u aşabilir)
+JOB_LEASE_RENEW_INTERVAL = float(os.getenv("JOB_LEASE_RENEW_INTERVAL", str(JOB_VISIBILITY_TIMEOUT / 3)))
+
+
+# ------------------------------------------------------------
+# DB helpers (threadpool içinde çalışır)
+# ------------------------------------------------------------
+def get_job(db: Session, job_id: str, user_id: int) -> Optional[GenerationJob]:
+    return (
+        db.query(GenerationJob)
+        .filter(GenerationJob.id == job_id, GenerationJob.user_id == user_id)
+        .first()
+    )
+
+
+def get_job_by_idempotency_key(db: Session, user_id: int, key: str) -> Optional[GenerationJob]:
+    return (
+        db.query(GenerationJob)
+        .filter(GenerationJob.user_id == user_id, GenerationJob.idempotency_key == key)
+        .first()
+    )
+
+
+def create_job(
+    db: Session,
+    user_id: int,
+    niche: str,
+    description: str,
+    reserved_on,
+    idempotency_key: Optional[str] = None,
+) -> Optional[GenerationJob]:
+    """
+    İşi kuyruğa yazar. Aynı Idempotency-Key ile yarış olduysa None döner.
+    """
+    job = GenerationJob(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        idempotency_key=idempotency_key,
+        niche=niche,
+        description=description,
+        status="queued",
+        attempts=0,
+        reserved_on=reserved_on,
+        created_at=datetime.utcnow(),
+    )
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    db.refresh(job)
+    return job
+
+
+def _claim_next() -> Optional[dict]:
+    """
+    Sıradaki işi tek UPDATE ... RETURNING ile kiralar.
+    "queued" işler ve kirası dolmuş "running" işler (ölü worker) alınabilir.
+    """
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        next_id = (
+            select(GenerationJob.id)
+            .where(
+                or_(
+                    GenerationJob.status == "queued",
+                    and_(
+                        GenerationJob.status == "running",
+                        GenerationJob.lease_expires_at < now,
+                    ),
+                )
+            )
+            .order_by(GenerationJob.created_at)
+            .limit(1)
+            .scalar_subquery()
+        )
+        row = db.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id == next_id)
+            .values(
+                status="running",
+                attempts=GenerationJob.attempts + 1,
+                lease_expires_at=now + timedelta(seconds=JOB_VISIBILITY_TIMEOUT),
+                started_at=func.coalesce(GenerationJob.started_at, now),
+            )
+            .returning(
+                GenerationJob.id,
+                GenerationJob.user_id,
+                GenerationJob.niche,
+                GenerationJob.description,
+                GenerationJob.attempts,
+                GenerationJob.reserved_on,
+                GenerationJob.created_at,
+            )
+        ).first()
+        db.commit()
+        if row is None:
+            return None
+
+        job = dict(row._mapping)
+        # Scheduler'da doğru plan kuyruğuna girsin
+        job["plan"] = db.query(User.plan).filter(User.id == job["user_id"]).scalar() or DEFAULT_PLAN
+        return job
+    finally:
+        db.close()
+
+
+def _owns_lease(job_id: str, attempts: int):
+    """
+    Kira hâlâ bizde mi: iş running ve başka worker tekrar almamış (attempts artmamış).
+    """
+    return and_(
+        GenerationJob.id == job_id,
+        GenerationJob.status == "running",
+        GenerationJob.attempts == attempts,
+    )
+
+
+def _renew_lease(job_id: str, attempts: int) -> bool:
+    db = SessionLocal()
+    try:
+        renewed = db.execute(
+            update(GenerationJob)
+            .where(_owns_lease(job_id, attempts))
+            .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=JOB_VISIBILITY_TIMEOUT))
+        ).rowcount
+        db.commit()
+        return renewed > 0
+    finally:
+        db.close()
+
+
+def _finish(
+    job_id: str,
+    attempts: int,
+    status: str,
+    result: Optional[str] = None,
+    error: Optional[str] = None,
+) -> bool:
+    """
+    Kira başka worker'a geçmişse hiçbir şey yazmaz, False döner (sonucu o worker yazar).
+    """
+    db = SessionLocal()
+    try:
+        finished = db.execute(
+            update(GenerationJob)
+            .where(_owns_lease(job_id, attempts))
+            .values(
+                status=status,
+                result=result,
+                error=error,
+                lease_expires_at=None,
+                finished_at=datetime.utcnow() if status in ("done", "failed") else None,
+            )
+        ).rowcount
+        db.commit()
+        return finished > 0
+    finally:
+        db.close()
+
+
+def _requeue_without_attempt(job_id: str, attempts: int) -> None:
+    """
+    Yoğunluk yüzünden hiç denenemeyen işi kuyruğa geri koyar; deneme hakkı yanmaz.
+    """
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(GenerationJob)
+            .where(_owns_lease(job_id, attempts))
+            .values(status="queued", attempts=GenerationJob.attempts - 1, lease_expires_at=None)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _counts() -> dict:
+    db = SessionLocal()
+    try:
+        by_status = dict(
+            db.query(GenerationJob.status, func.count(GenerationJob.id))
+            .group_by(GenerationJob.status)
+            .all()
+        )
+        oldest_queued = (
+            db.query(func.min(GenerationJob.created_at))
+            .filter(GenerationJob.status == "queued")
+            .scalar()
+        )
+        return {"by_status": by_status, "oldest_queued": oldest_queued}
+    finally:
+        db.close()
+
+
+# ------------------------------------------------------------
+# Worker havuzu
+# ------------------------------------------------------------
+class JobQueue:
+    """
+    SQLite tablosu üzerinde kalıcı iş kuyruğu.
+    - Worker'lar işleri kiralık (lease) alır; process ölürse kira dolunca iş tekrar alınır.
+    - Üretim sürerken kira uzatılır; kira yine de kaybedilirse (uzun duraklama) üretim
+      iptal edilir ve sonuç yazılmaz (attempts eşleşmesi), iş yeni sahibinde kalır.
+    - Geçici hatada iş JOB_MAX_ATTEMPTS'e kadar tekrar kuyruğa girer,
+      son denemede de başarısız olursa free plan hakkı iade edilir.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._tasks: list = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.deferred = 0               # yoğunluk (429) yüzünden ertelenen
+        self.lease_lost = 0             # kirası başka worker'a geçen
+        self.wait_seconds_total = 0.0   # created -> ilk alınış
+        self.age_seconds_total = 0.0    # created -> bitiş
+        self.max_age_seconds = 0.0
+
+    def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        """
+        Yeni iş geldi -> bekleyen worker'ları poll süresini beklemeden uyandır.
+        """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job = await run_in_threadpool(_claim_next)
+            except Exception:
+                logger.exception("Is kuyrugundan is alinamadi")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            await self._process(job)
+
+    async def _process(self, job: dict) -> None:
+        if job["attempts"] == 1:
+            self.started += 1
+            self.wait_seconds_total += (datetime.utcnow() - job["created_at"]).total_seconds()
+
+        if job["attempts"] > JOB_MAX_ATTEMPTS:
+            await self._give_up(job, "Deneme siniri asildi.")
+            return
+
+        work = asyncio.ensure_future(
+            generation.generate(
+                description=job["description"],
+                niche=job["niche"] or "",
+                user_id=job["user_id"],
+                plan=job["plan"],
+            )
+        )
+        keeper = asyncio.ensure_future(self._keep_lease(job, work))
+        try:
+            result_text, _ = await work
+        except asyncio.CancelledError:
+            if job.get("lease_lost") and not asyncio.current_task().cancelling():
+                # Kira başka worker'a geçti; iş onda, burada yazılacak bir şey yok
+                self.lease_lost += 1
+                return
+            # Kapanış: işi kuyruğa geri bırak, sonraki açılışta devam edilir
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(_finish, job["id"], job["attempts"], "queued")
+            raise
+        except Overloaded as exc:
+            # Upstream sırası dolu -> iş kuyrukta beklesin, worker da biraz dursun
+            await run_in_threadpool(_requeue_without_attempt, job["id"], job["attempts"])
+            self.deferred += 1
+            await asyncio.sleep(exc.retry_after)
+            return
+        except Exception:
+            logger.exception("Is basarisiz: %s", job["id"])
+            if job["attempts"] >= JOB_MAX_ATTEMPTS:
+                await self._give_up(job, "Uretim sirasinda hata olustu.")
+            else:
+                self.retried += 1
+                await run_in_threadpool(_finish, job["id"], job["attempts"], "queued")
+            return
+        finally:
+            keeper.cancel()
+
+        if not await run_in_threadpool(_finish, job["id"], job["attempts"], "done", result_text):
+            self.lease_lost += 1
+            return
+        self.completed += 1
+        self._record_age(job)
+
+    async def _keep_lease(self, job: dict, work: asyncio.Future) -> None:
+        """
+        Üretim bitene kadar kirayı uzatır. Kira kaybedildiyse üretimi iptal eder
+        (aynı iş için ikinci upstream çağrısı sürmesin).
+        """
+        while True:
+            await asyncio.sleep(JOB_LEASE_RENEW_INTERVAL)
+            try:
+                renewed = await run_in_threadpool(_renew_lease, job["id"], job["attempts"])
+            except Exception:
+                # Geçici DB hatası: kira dolmadan bir sonraki turda tekrar denenir
+                logger.exception("Is kirasi uzatilamadi: %s", job["id"])
+                continue
+            if not renewed:
+                logger.warning("Is kirasi kaybedildi: %s", job["id"])
+                job["lease_lost"] = True
+                work.cancel()
+                return
+
+    async def _give_up(self, job: dict, error: str) -> None:
+        if not await run_in_threadpool(_finish, job["id"], job["attempts"], "failed", None, error):
+            # Kira başka worker'da; hak iadesi de onun kararı
+            self.lease_lost += 1
+            return
+        self.failed += 1
+        self._record_age(job)
+
+        db = SessionLocal()
+        try:
+            await quota.release(db, job["user_id"], job["reserved_on"])
+        finally:
+            db.close()
+
+    def _record_age(self, job: dict) -> None:
+        age = (datetime.utcnow() - job["created_at"]).total_seconds()
+        self.age_seconds_total += age
+        self.max_age_seconds = max(self.max_age_seconds, age)
+
+    def stats(self) -> dict:
+        counts = _counts()
+        by_status = counts["by_status"]
+        oldest = counts["oldest_queued"]
+        finished = self.completed + self.failed
+        return {
+            "workers": self.workers,
+            "queue_depth": by_status.get("queued", 0),
+            "running": by_status.get("running", 0),
+            "done": by_status.get("done", 0),
+            "failed": by_status.get("failed", 0),
+            "oldest_queued_age_seconds": (
+                round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else 0.0
+            ),
+            # Aşağıdakiler bu process'e ait sayaçlar
+            "completed": self.completed,
+            "given_up": self.failed,
+            "retried": self.retried,
+            "deferred": self.deferred,
+            "lease_lost": self.lease_lost,
+            "avg_wait_seconds": round(self.wait_seconds_total / self.started, 3) if self.started else 0.0,
+            "avg_age_seconds": round(self.age_seconds_total / finished, 3) if finished else 0.0,
+            "max_age_seconds": round(self.max_age_seconds, 3),
+        }
+
+
+job_queue = JobQueue(workers=JOB_WORKERS)
@@ -0,0 +1,349 @@
+# llm.py
+import os
+import asyncio
+import logging
+
+from openai import AuthenticationError, PermissionDeniedError, RateLimitError
+from dotenv import load_dotenv
+
+from prompts import SYSTEM_PROMPT
+from ratelimit import LLM_EST_COMPLETION_TOKENS, estimate_prompt_tokens
+from resilience import upstream_guard
+from upstream_http import (
+    LLM_CONNECT_TIMEOUT,
+    LLM_KEEPWARM_SECONDS,
+    LLM_WARMUP_CONNECTIONS,
+    build_http_client,
+    connection_metrics,
+)
+from upstream_pool import LLM_KEY_QUOTA_COOLDOWN, KeyPool, NoUpstreamKey, parse_api_keys
+
+logger = logging.getLogger(__name__)
+
+# ---------- .env yükle ----------
+load_dotenv()
+
+# ------------------------------------------------------------
+# Upstream ayarları (.env ile değiştirilebilir)
+# ------------------------------------------------------------
+MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+TEMPERATURE = 0.8
+
+# openai: api.openai.com | compatible: LLM_BASE_URL'deki OpenAI uyumlu sunucu | fake: süreç içi sahte
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL")
+
+if LLM_BACKEND not in ("openai", "compatible", "fake"):
+    raise RuntimeError("LLM_BACKEND 'openai', 'compatible' veya 'fake' olmali.")
+if LLM_BACKEND == "compatible" and not LLM_BASE_URL:
+    raise RuntimeError("LLM_BACKEND=compatible icin LLM_BASE_URL gerekli.")
+
+# ---------- OpenAI key'leri ----------
+api_keys = parse_api_keys(os.getenv("OPENAI_API_KEYS") or os.getenv("OPENAI_API_KEY") or "")
+if not api_keys and LLM_BACKEND == "openai":
+    raise RuntimeError("OPENAI_API_KEY (veya OPENAI_API_KEYS) .env dosyasından okunamadı.")
+if not api_keys:
+    # Yerel uyumlu sunucular / fake key istemez
+    api_keys = [("local-no-key", 1.0)]
+
+# Tüm istekler aynı bağlantı havuzunu paylaşır (ayarlar upstream_http.py'de)
+http_client = build_http_client()
+
+# Her key'in kendi client'ı ve rate limit bütçesi var, bağlantı havuzu ortak
+key_pool = KeyPool(api_keys, http_client, base_url=LLM_BASE_URL if LLM_BACKEND == "compatible" else None)
+
+
+# ------------------------------------------------------------
+# Prompt helpers
+# ------------------------------------------------------------
+def build_messages(description: str, niche: str = "") -> list:
+    user_prompt = f"""
+Nis: {niche}
+
+Video/Post aciklamasi:
+\"\"\"{description}\"\"\"
+"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+# ------------------------------------------------------------
+# Backend'ler: complete() tek deneme, open_stream() tek akış açar.
+# Retry / hedge / breaker bunların üstünde (upstream_guard) uygulanır.
+# ------------------------------------------------------------
+class _OpenAIStream:
+    """
+    OpenAI stream'ini (delta, usage) adımlarına çevirir.
+    """
+
+    def __init__(self, key, stream, estimated_tokens: int):
+        self._key = key
+        self._stream = stream
+        self._iterator = stream.__aiter__()
+        self._estimated = estimated_tokens
+
+    async def next(self):
+        """
+        Sıradaki anlamlı adım; akış bittiyse None.
+        """
+        while True:
+            try:
+                chunk = await self._iterator.__anext__()
+            except StopAsyncIteration:
+                return None
+
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta and not chunk.usage:
+                continue
+
+            usage = None
+            if chunk.usage:
+                _settle(self._key, self._estimated, chunk.usage)
+                usage = {
+                    "prompt_tokens": chunk.usage.prompt_tokens,
+                    "completion_tokens": chunk.usage.completion_tokens,
+                    "total_tokens": chunk.usage.total_tokens,
+                }
+            return delta or "", usage
+
+    async def close(self) -> None:
+        await self._stream.close()
+
+
+class OpenAIBackend:
+    """
+    api.openai.com veya OpenAI uyumlu bir base URL; key havuzu ve rate limit üzerinden.
+    """
+
+    def __init__(self, name: str, pool: KeyPool):
+        self.name = name
+        self.pool = pool
+
+    async def _create(self, messages: list, estimated_tokens: int, **kwargs):
+        """
+        Havuzdan key seçer, o key'in rate limit bütçesini alıp isteği gönderir,
+        cevap header'larıyla bütçeyi düzeltir. (key, ham cevap) döner; çağıran parse() eder.
+        Auth / kota hatası veren key havuzdan çıkarılır ve istek hemen başka key ile denenir.
+        """
+        tried = ()
+        while True:
+            try:
+                key = self.pool.pick(estimated_tokens, exclude=tried)
+            except NoUpstreamKey:
+                if tried:
+                    # Hepsi denendi -> son key'in hatası geçerli
+                    raise last_error
+                raise
+            tried += (key,)
+
+            await key.limiter.acquire(estimated_tokens)
+            key.in_flight += 1
+            key.requests += 1
+            try:
+                raw = await key.client.chat.completions.with_raw_response.create(
+                    model=MODEL,
+                    messages=messages,
+                    temperature=TEMPERATURE,
+                    **kwargs,
+                )
+            except (AuthenticationError, PermissionDeniedError) as exc:
+                key.errors += 1
+                key.last_error = type(exc).__name__
+                key.disable("auth")
+                last_error = exc
+                continue
+            except RateLimitError as exc:
+                key.errors += 1
+                key.last_error = type(exc).__name__
+                if exc.code == "insufficient_quota":
+                    key.disable("quota", LLM_KEY_QUOTA_COOLDOWN)
+                    last_error = exc
+                    continue
+                key.limiter.on_rate_limited(exc.response.headers)
+                raise
+            except Exception as exc:
+                key.errors += 1
+                key.last_error = type(exc).__name__
+                raise
+            finally:
+                key.in_flight -= 1
+
+            key.limiter.sync_headers(raw.headers)
+            return key, raw
+
+    async def complete(self, messages: list, estimated_tokens: int) -> str:
+        key, raw = await self._create(messages, estimated_tokens)
+        response = raw.parse()
+        _settle(key, estimated_tokens, response.usage)
+        return response.choices[0].message.content.strip()
+
+    async def open_stream(self, messages: list, estimated_tokens: int) -> _OpenAIStream:
+        key, raw = await self._create(
+            messages,
+            estimated_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        return _OpenAIStream(key, raw.parse(), estimated_tokens)
+
+    async def warm_up(self, connections: int) -> None:
+        """
+        DNS + TCP + TLS maliyetini ilk kullanıcıdan önce öde: paralel hafif istekler
+        (GET /models, token harcamaz) havuzda sıcak bağlantı bırakır.
+        """
+        key = self.pool.pick(0)
+        results = await asyncio.gather(
+            *(key.client.models.list() for _ in range(connections)),
+            return_exceptions=True,
+        )
+        failed = [r for r in results if isinstance(r, BaseException)]
+        if failed:
+            logger.warning("Upstream isinma istegi basarisiz: %r", failed[0])
+
+    def stats(self) -> dict:
+        return {"backend": self.name, **self.pool.stats()}
+
+
+def _settle(key, estimated_tokens: int, usage) -> None:
+    if usage is not None:
+        key.tokens += usage.total_tokens
+        key.limiter.settle(estimated_tokens, usage.total_tokens)
+
+
+if LLM_BACKEND == "fake":
+    from fake_llm import FakeBackend
+
+    backend = FakeBackend()
+else:
+    backend = OpenAIBackend(LLM_BACKEND, key_pool)
+
+
+# ------------------------------------------------------------
+# Bağlantı ısıtma (api.py lifespan'inden çağrılıyor)
+# ------------------------------------------------------------
+_keepwarm_task = None
+
+
+async def warm_up() -> None:
+    if LLM_WARMUP_CONNECTIONS <= 0 or not hasattr(backend, "warm_up"):
+        return
+    try:
+        await asyncio.wait_for(backend.warm_up(LLM_WARMUP_CONNECTIONS), LLM_CONNECT_TIMEOUT * 2)
+    except Exception:
+        # Isınmasa da açılış engellenmesin
+        logger.exception("Upstream isinmasi yapilamadi")
+
+
+async def _keepwarm_loop() -> None:
+    """
+    Aralık boyunca hiç upstream isteği olmadıysa tek hafif istekle bağlantıyı canlı tut.
+    """
+    last_seen = connection_metrics.requests
+    while True:
+        await asyncio.sleep(LLM_KEEPWARM_SECONDS)
+        if connection_metrics.requests == last_seen:
+            try:
+                await backend.warm_up(1)
+            except Exception:
+                logger.exception("Upstream keep-warm istegi basarisiz")
+        last_seen = connection_metrics.requests
+
+
+def start_keepwarm() -> None:
+    global _keepwarm_task
+    if LLM_KEEPWARM_SECONDS > 0 and hasattr(backend, "warm_up") and _keepwarm_task is None:
+        _keepwarm_task = asyncio.ensure_future(_keepwarm_loop())
+
+
+# ---------- Caption üretim mantığı ----------
+# Client koptuğu için yarıda kesilen upstream çağrıları (token tahmini kabaca, ~4 karakter = 1 token)
+cancel_stats = {"cancelled": 0, "cancelled_streams": 0, "tokens_saved_estimate": 0}
+
+
+def _record_cancel(received_chars: int = 0, streaming: bool = False) -> None:
+    cancel_stats["cancelled"] += 1
+    if streaming:
+        cancel_stats["cancelled_streams"] += 1
+    cancel_stats["tokens_saved_estimate"] += max(0, LLM_EST_COMPLETION_TOKENS - received_chars // 4)
+
+
+async def _open_first(messages: list, estimated: int):
+    """
+    Stream'i açıp ilk anlamlı adımı bekler (retry / hedge bu noktaya kadar mümkün).
+    (stream, ilk_adım | None) döner.
+    """
+    stream = await backend.open_stream(messages, estimated)
+    try:
+        return stream, await stream.next()
+    except BaseException:
+        # Timeout / hedge'i kaybetme / hata -> bağlantıyı bırak
+        await stream.close()
+        raise
+
+
+async def _discard_stream(opened) -> None:
+    await opened[0].close()
+
+
+async def generate_captions_and_hashtags(description: str, niche: str = "") -> str:
+    messages = build_messages(description, niche)
+    estimated = estimate_prompt_tokens(messages) + LLM_EST_COMPLETION_TOKENS
+
+    try:
+        return await upstream_guard.run(lambda: backend.complete(messages, estimated), kind="complete")
+    except asyncio.CancelledError:
+        # Bekleyen HTTP isteği de iptal edildi -> cevap üretimi (ve faturası) kesilir
+        _record_cancel()
+        raise
+
+
+async def stream_captions_and_hashtags(description: str, niche: str = ""):
+    """
+    Upstream'den gelen token'ları geldikçe verir.
+    Her adımda (delta, usage) döner:
+    - delta: yeni gelen metin parçası ("" olabilir)
+    - usage: sadece son chunk'ta dolu, {"prompt_tokens", "completion_tokens", "total_tokens"}
+    """
+    messages = build_messages(description, niche)
+    estimated = estimate_prompt_tokens(messages) + LLM_EST_COMPLETION_TOKENS
+
+    # İlk token'a kadar timeout / retry / hedge geçerli; sonrası httpx read timeout'u ile korunur
+    try:
+        stream, step = await upstream_guard.run(
+            lambda: _open_first(messages, estimated),
+            kind="stream",
+            discard=_discard_stream,
+        )
+    except asyncio.CancelledError:
+        _record_cancel(streaming=True)
+        raise
+
+    received_chars = 0
+    try:
+        while step is not None:
+            delta, usage = step
+            if delta:
+                received_chars += len(delta)
+                yield delta, None
+            if usage:
+                yield "", usage
+            step = await stream.next()
+    except (asyncio.CancelledError, GeneratorExit):
+        _record_cancel(received_chars, streaming=True)
+        raise
+    finally:
+        # Client erken koparsa upstream bağlantısını da bırak
+        await stream.close()
+
+
+async def aclose() -> None:
+    """
+    Uygulama kapanırken bağlantı havuzunu kapat.
+    """
+    global _keepwarm_task
+    if _keepwarm_task is not None:
+        _keepwarm_task.cancel()
+        _keepwarm_task = None
+    await http_client.aclose()
@@ -0,0 +1,78 @@
+# loop_monitor.py
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Optional
+
+# ------------------------------------------------------------
+# Event loop gecikme ölçümü (.env ile değiştirilebilir)
+# Async endpoint içinde senkron iş (DB sorgusu, bcrypt...) çalışırsa tüm worker durur;
+# bu durma süresi burada görünür.
+# ------------------------------------------------------------
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "1") == "1"
+# Nabız aralığı: bu kadar uyuyup ne kadar geç uyandığımıza bakılır
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.05"))
+# Bu kadar ms'den uzun gecikme "blok" sayılır
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "20"))
+
+
+class LoopMonitor:
+    """
+    asyncio.sleep(interval) beklenenden ne kadar geç dönüyorsa loop o kadar bloklanmış demektir.
+    """
+
+    def __init__(self, interval: float, threshold_ms: float):
+        self.interval = interval
+        self.threshold = threshold_ms / 1000.0
+        self._task: Optional[asyncio.Task] = None
+
+        self.samples = 0
+        self.blocks = 0
+        self.blocked_seconds_total = 0.0
+        self.lag_seconds_max = 0.0
+        self.recent_lags: deque = deque(maxlen=2000)
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - started - self.interval)
+
+            self.samples += 1
+            self.recent_lags.append(lag)
+            self.lag_seconds_max = max(self.lag_seconds_max, lag)
+            if lag >= self.threshold:
+                self.blocks += 1
+                self.blocked_seconds_total += lag
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        lags = sorted(self.recent_lags)
+
+        def pct(p: float) -> float:
+            if not lags:
+                return 0.0
+            return round(lags[min(len(lags) - 1, int(len(lags) * p))] * 1000, 2)
+
+        return {
+            "interval_ms": round(self.interval * 1000, 1),
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "samples": self.samples,
+            "lag_ms_p50": pct(0.50),
+            "lag_ms_p99": pct(0.99),
+            "lag_ms_max": round(self.lag_seconds_max * 1000, 2),
+            "blocks": self.blocks,
+            "blocked_ms_total": round(self.blocked_seconds_total * 1000, 2),
+        }
+
+
+loop_monitor = LoopMonitor(LOOP_MONITOR_INTERVAL, LOOP_BLOCK_THRESHOLD_MS) if LOOP_MONITOR_ENABLED else None
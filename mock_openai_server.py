@@ -0,0 +1,242 @@
+# mock_openai_server.py
+"""
+OpenAI uyumlu sahte HTTP sunucusu (/v1/chat/completions), yük testi için.
+Gerçek HTTP yolu (bağlantı havuzu, retry, rate limit header'ları) ağ olmadan ölçülebilir.
+
+Kullanim:
+  python mock_openai_server.py --port 8001 --latency-ms 400 --jitter-ms 200 --error-rate 0.02
+  # API'yi buna yönlendir:
+  LLM_BACKEND=compatible LLM_BASE_URL=http://127.0.0.1:8001/v1 uvicorn api:app
+
+Destekler:
+  - stream=true (SSE, chat.completion.chunk) ve stream_options.include_usage
+  - usage alanları
+  - x-ratelimit-limit/remaining/reset-{requests,tokens} header'ları (dakikalık pencere)
+  - gecikme + jitter, rastgele 429 / 5xx, pencere dolunca gerçek 429
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from fake_llm import split_tokens, user_text, fake_captions
+from ratelimit import estimate_prompt_tokens
+
+
+class MockConfig:
+    """
+    Env ile (MOCK_LLM_*) ya da komut satırından ayarlanır.
+    """
+
+    def __init__(self):
+        self.latency_ms = float(os.getenv("MOCK_LLM_LATENCY_MS", "300"))
+        self.jitter_ms = float(os.getenv("MOCK_LLM_JITTER_MS", "100"))
+        self.tokens_per_second = float(os.getenv("MOCK_LLM_TOKENS_PER_SECOND", "80"))
+        self.error_rate = float(os.getenv("MOCK_LLM_ERROR_RATE", "0"))
+        self.rate_limit_rate = float(os.getenv("MOCK_LLM_RATE_LIMIT_RATE", "0"))
+        self.rpm = int(os.getenv("MOCK_LLM_RPM", "10000"))
+        self.tpm = int(os.getenv("MOCK_LLM_TPM", "2000000"))
+
+
+config = MockConfig()
+app = FastAPI(title="Mock OpenAI")
+
+
+def _format_reset(seconds: float) -> str:
+    # OpenAI formatı: "120ms", "1.5s", "6m0s"
+    if seconds < 1:
+        return f"{int(seconds * 1000)}ms"
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    return f"{int(seconds // 60)}m{int(seconds % 60)}s"
+
+
+class _Window:
+    """
+    Dakikalık sabit pencere; gerçek API'deki gibi remaining / reset header'ları üretir.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.tokens = 0
+
+        self.served = 0
+        self.rejected_429 = 0
+        self.failed_5xx = 0
+
+    def _roll(self) -> float:
+        now = time.monotonic()
+        if now - self.started >= 60:
+            self.started = now
+            self.requests = 0
+            self.tokens = 0
+        return 60 - (now - self.started)
+
+    def try_take(self, tokens: int) -> bool:
+        self._roll()
+        if self.requests + 1 > config.rpm or self.tokens + tokens > config.tpm:
+            return False
+        self.requests += 1
+        self.tokens += tokens
+        return True
+
+    def headers(self) -> dict:
+        reset = self._roll()
+        requests_left = max(0, config.rpm - self.requests)
+        tokens_left = max(0, config.tpm - self.tokens)
+        return {
+            "x-ratelimit-limit-requests": str(config.rpm),
+            "x-ratelimit-remaining-requests": str(requests_left),
+            "x-ratelimit-reset-requests": _format_reset(reset if self.requests else 0),
+            "x-ratelimit-limit-tokens": str(config.tpm),
+            "x-ratelimit-remaining-tokens": str(tokens_left),
+            "x-ratelimit-reset-tokens": _format_reset(reset if self.tokens else 0),
+        }
+
+
+window = _Window()
+
+
+def _error(status: int, message: str, error_type: str, code: str, headers: dict) -> JSONResponse:
+    return JSONResponse(
+        status_code=status,
+        content={"error": {"message": message, "type": error_type, "param": None, "code": code}},
+        headers=headers,
+    )
+
+
+def _ttft() -> float:
+    return max(0.0, config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000.0
+
+
+@app.get("/v1/models")
+def list_models():
+    return {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "owned_by": "mock"}]}
+
+
+@app.get("/stats")
+def stats():
+    return {
+        "served": window.served,
+        "rejected_429": window.rejected_429,
+        "failed_5xx": window.failed_5xx,
+        **window.headers(),
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages") or []
+    model = body.get("model", "gpt-4o-mini")
+
+    niche, description = user_text(messages)
+    text = fake_captions(niche, description)
+    prompt_tokens = estimate_prompt_tokens(messages)
+    completion_tokens = max(1, len(text) // 4)
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+    # Hata / rate limit ancak bir süre sonra döner (gerçek round trip gibi)
+    await asyncio.sleep(_ttft())
+
+    # Önce enjekte edilen hatalar: 5xx RPM / TPM bütçesinden yemesin (429 oranı şişmesin)
+    roll = random.random()
+    if config.rate_limit_rate <= roll < config.rate_limit_rate + config.error_rate:
+        window.failed_5xx += 1
+        return _error(500, "The server had an error (mock).", "server_error", None, {})
+    if roll < config.rate_limit_rate or not window.try_take(usage["total_tokens"]):
+        window.rejected_429 += 1
+        headers = window.headers()
+        headers["retry-after"] = "1"
+        return _error(429, "Rate limit reached (mock).", "requests", "rate_limit_exceeded", headers)
+
+    window.served += 1
+    headers = window.headers()
+    completion_id = f"chatcmpl-mock{random.getrandbits(48):x}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        await asyncio.sleep(completion_tokens / config.tokens_per_second)
+        return JSONResponse(
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            },
+            headers=headers,
+        )
+
+    include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+    def chunk(delta: dict, finish_reason=None, with_usage=False) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [] if with_usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        if with_usage:
+            payload["usage"] = usage
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    async def events():
+        yield chunk({"role": "assistant", "content": ""})
+        for token in split_tokens(text):
+            await asyncio.sleep(1.0 / config.tokens_per_second)
+            yield chunk({"content": token})
+        yield chunk({}, finish_reason="stop")
+        if include_usage:
+            yield chunk({}, with_usage=True)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI uyumlu mock sunucu")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=config.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=config.jitter_ms)
+    parser.add_argument("--tokens-per-second", type=float, default=config.tokens_per_second)
+    parser.add_argument("--error-rate", type=float, default=config.error_rate)
+    parser.add_argument("--rate-limit-rate", type=float, default=config.rate_limit_rate)
+    parser.add_argument("--rpm", type=int, default=config.rpm)
+    parser.add_argument("--tpm", type=int, default=config.tpm)
+    args = parser.parse_args()
+
+    config.latency_ms = args.latency_ms
+    config.jitter_ms = args.jitter_ms
+    config.tokens_per_second = args.tokens_per_second
+    config.error_rate = args.error_rate
+    config.rate_limit_rate = args.rate_limit_rate
+    config.rpm = args.rpm
+    config.tpm = args.tpm
+
+    import uvicorn
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
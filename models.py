@@ -1,5 +1,5 @@
 # models.py
-from sqlalchemy import Column, Integer, String, DateTime, Date, ForeignKey
+from sqlalchemy import Column, Integer, Float, String, Text, DateTime, Date, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -18,12 +18,35 @@ class User(Base):
     plan = Column(String, nullable=False, default="free")
     device_id = Column(String, nullable=True, index=True)
     register_ip = Column(String, nullable=True, index=True)  # İstersen IP de kalsın
+    # Plan değişince artırılır -> eski JWT'ler (eski plan claim'i) geçersiz olur
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     # Iliski
     usages = relationship("CaptionUsage", back_populates="user")
 
 
+class Plan(Base):
+    __tablename__ = "plans"
+
+    # users.plan bu isme bakar ("free", "pro", ...)
+    name = Column(String, primary_key=True)
+    # None -> sınırsız
+    daily_limit = Column(Integer, nullable=True)
+    monthly_limit = Column(Integer, nullable=True)
+    max_batch_items = Column(Integer, nullable=False, default=100)
+    # Kullanıcı başına aynı anda LLM'de olabilecek istek
+    max_concurrency = Column(Integer, nullable=False, default=1)
+    # Yoğunlukta sıra alma ağırlığı (scheduler)
+    priority_weight = Column(Float, nullable=False, default=1.0)
+    # Worker'lar cache'i bu değişince yeniler
+    updated_at = Column(DateTime, nullable=False)
+
+
 class CaptionUsage(Base):
     __tablename__ = "caption_usages"
+    __table_args__ = (
+        # Kullanıcı başına günde tek satır -> hak ayırma tek upsert ile atomik (quota.py)
+        Index("uq_caption_usages_user_date", "user_id", "date", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
@@ -31,3 +54,34 @@ class CaptionUsage(Base):
     count = Column(Integer, nullable=False, default=0)
 
     user = relationship("User", back_populates="usages")
+
+
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+    __table_args__ = (
+        # Aynı Idempotency-Key ile tekrar gönderilen iş yeni iş açmasın
+        UniqueConstraint("user_id", "idempotency_key", name="uq_generation_jobs_user_idempotency"),
+    )
+
+    id = Column(String, primary_key=True)  # uuid4 hex
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    idempotency_key = Column(String, nullable=True)
+
+    niche = Column(String, nullable=False, default="")
+    description = Column(Text, nullable=False)
+
+    # status: "queued" -> "running" -> "done" / "failed"
+    status = Column(String, index=True, nullable=False, default="queued")
+    result = Column(Text, nullable=True)
+    error = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+
+    # Free plan hakkı submit anında ayrılıyor; iş başarısız biterse bu güne iade edilir
+    reserved_on = Column(Date, nullable=True)
+
+    # Worker işi "kiralar"; süre dolarsa (process öldü) iş tekrar alınabilir
+    lease_expires_at = Column(DateTime, nullable=True, index=True)
+
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
@@ -0,0 +1,268 @@
+# passwords.py
+import os
+import math
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from passlib.hash import bcrypt
+
+from scheduler import Overloaded
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------
+# Şifre hash havuzu ayarları (.env ile değiştirilebilir)
+# bcrypt CPU'yu kasten yakar; request thread'inde / GIL altında çalışırsa login
+# trafiği tüm worker'ı yavaşlatır. Ayrı process havuzunda çekirdek sayısıyla ölçeklenir.
+# ------------------------------------------------------------
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", str(os.cpu_count() or 1)))
+# Çalışanlar doluyken sırada bekleyebilecek hash işi; doluysa hemen 429
+PASSWORD_POOL_MAX_QUEUE = int(os.getenv("PASSWORD_POOL_MAX_QUEUE", "64"))
+# Tek hash / doğrulama en fazla bu kadar beklenir (sıra + hesap), sonra 429
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "5"))
+# Açılışta process'lerin başlaması + kalibrasyon için süre (çok çekirdekte spawn uzun sürer)
+PASSWORD_POOL_START_TIMEOUT = float(os.getenv("PASSWORD_POOL_START_TIMEOUT", "60"))
+# Kalibrasyonda ölçülen hash sayısı (medyan alınır)
+BCRYPT_CALIBRATION_SAMPLES = int(os.getenv("BCRYPT_CALIBRATION_SAMPLES", "3"))
+# Sabit maliyet; boşsa açılışta BCRYPT_TARGET_MS'e göre ölçülür
+BCRYPT_ROUNDS = os.getenv("BCRYPT_ROUNDS", "")
+# Kalibrasyon hedefi: tek hash'in bu sunucuda sürmesi istenen süre
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "250"))
+# Kalibrasyon bu aralığın dışına çıkmaz (10 altı güvenli sayılmaz)
+BCRYPT_MIN_ROUNDS = int(os.getenv("BCRYPT_MIN_ROUNDS", "10"))
+BCRYPT_MAX_ROUNDS = int(os.getenv("BCRYPT_MAX_ROUNDS", "15"))
+# passlib'in bcrypt varsayılanı (kalibrasyon öncesi / sync yardımcılar)
+_DEFAULT_ROUNDS = 12
+
+
+# ------------------------------------------------------------
+# Havuz process'lerinde çalışan fonksiyonlar
+# (spawn ile yeni process bu modülü import eder -> modül seviyesi hafif kalmalı)
+# ------------------------------------------------------------
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.using(rounds=rounds).hash(password)
+
+
+def _verify(password: str, hashed: Optional[str]) -> bool:
+    if not hashed:
+        # Şifresiz kayıt (sync.py NULL hashed_password ile ekleyebiliyor)
+        return False
+    try:
+        return bcrypt.verify(password, hashed)
+    except (ValueError, TypeError):
+        # bcrypt olmayan / bozuk hash -> şifre eşleşmiyor say
+        return False
+
+
+def _time_hash(rounds: int) -> float:
+    started = time.perf_counter()
+    _hash("calibration-password", rounds)
+    return time.perf_counter() - started
+
+
+def _warm() -> None:
+    return None
+
+
+def hash_rounds(hashed: str) -> Optional[int]:
+    """
+    "$2b$12$..." -> 12
+    """
+    try:
+        return int(hashed.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """
+    bcrypt işleri için sınırlı process havuzu.
+    - Aynı anda en fazla workers + max_queue iş kabul edilir; fazlası hemen Overloaded (429).
+    - Her iş timeout saniyede bitmezse Overloaded; başlamamış iş kuyruktan düşer.
+    - Maliyet (rounds) açılışta hedef süreye göre ölçülür; login'de hash'in maliyeti
+      farklıysa şifre yeni maliyetle yeniden hash'lenir (auth.login).
+    Sayaçlar sadece event loop içinden değişiyor, kilit gerekmez.
+    """
+
+    def __init__(self, workers: int, max_queue: int, timeout: float):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.rounds = int(BCRYPT_ROUNDS) if BCRYPT_ROUNDS else _DEFAULT_ROUNDS
+        # Ölçülen maliyette worker'lar farklı sonuç bulabilir; o zaman sadece yukarı
+        # yönde yeniden hash'lenir (worker'lar arası sürekli yeniden hash olmasın)
+        self.calibrated = False
+        self.calibrated_ms: Optional[float] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+
+        self.hashed = 0
+        self.verified = 0
+        self.rehashed = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.pool_restarts = 0
+        self.busy_seconds_total = 0.0
+        self.latency_seconds_max = 0.0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # fork, çalışan thread'lerin (threadpool, flusher) kilitlerini kopyalayabilir
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def _run(self, fn, *args, timeout: Optional[float] = None):
+        if self._pending >= self.workers + self.max_queue:
+            self.rejected_queue_full += 1
+            raise Overloaded(self.retry_after(), "password_queue_full")
+
+        self._pending += 1
+        try:
+            # Havuz bozulduysa (child OOM / crash, spawn import hatası) yenisiyle bir kez daha
+            for retry in (True, False):
+                executor = self._pool()
+                try:
+                    return await self._submit(executor, fn, args, timeout or self.timeout)
+                except BrokenProcessPool:
+                    self._reset_pool(executor)
+                    if not retry:
+                        raise Overloaded(self.retry_after(), "password_pool_broken")
+        finally:
+            self._pending -= 1
+
+    async def _submit(self, executor: ProcessPoolExecutor, fn, args: tuple, timeout: float):
+        future = executor.submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            # Henüz başlamadıysa kuyruktan çıkar; başladıysa process'te biter, sonucu atılır
+            future.cancel()
+            self.rejected_timeout += 1
+            raise Overloaded(self.retry_after(), "password_timeout")
+
+    def _reset_pool(self, executor: ProcessPoolExecutor) -> None:
+        """
+        Bozuk havuz bir daha iş kabul etmez; kapatılır, _pool() sonraki işte yenisini açar.
+        Sadece bozulan havuz kapatılır: aynı anda bozulmayı gören diğer işler, biri
+        yenisini açtıktan sonra onu da kapatmasın.
+        """
+        if self._executor is executor:
+            self._executor = None
+            logger.warning("Şifre havuzu bozuldu, yeniden başlatılıyor")
+            self.pool_restarts += 1
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _record(self, started: float) -> None:
+        elapsed = time.monotonic() - started
+        self.busy_seconds_total += elapsed
+        self.latency_seconds_max = max(self.latency_seconds_max, elapsed)
+
+    def retry_after(self) -> int:
+        per_job = (self.calibrated_ms or BCRYPT_TARGET_MS) / 1000.0
+        return max(1, math.ceil(per_job * (self._pending + 1) / self.workers))
+
+    # ---------- public ----------
+    async def start(self) -> None:
+        """
+        Process'leri açılışta başlat (ilk login spawn maliyetini ödemesin) ve maliyeti ölç.
+        Süre PASSWORD_POOL_START_TIMEOUT ile sınırlı; aşılırsa ya da havuz açılamazsa
+        uygulama yine açılır, maliyet varsayılanda kalır (havuz ilk işte tekrar denenir).
+        """
+        try:
+            await asyncio.gather(
+                *(self._run(_warm, timeout=PASSWORD_POOL_START_TIMEOUT) for _ in range(self.workers))
+            )
+            # Ölçüm, tüm process'ler ayağa kalktıktan sonra (spawn CPU'yu paylaşmasın)
+            if not BCRYPT_ROUNDS:
+                await self.calibrate()
+        except (Overloaded, BrokenProcessPool):
+            logger.warning(
+                "Şifre havuzu %s sn içinde başlatılamadı; bcrypt maliyeti %s",
+                PASSWORD_POOL_START_TIMEOUT,
+                self.rounds,
+                exc_info=True,
+            )
+
+    async def calibrate(self) -> int:
+        """
+        BCRYPT_MIN_ROUNDS'ta BCRYPT_CALIBRATION_SAMPLES hash ölçülür (medyan); her +1 round
+        süreyi ikiye katlar, hedefi aşmayan en yüksek round seçilir.
+        """
+        samples = []
+        for _ in range(max(1, BCRYPT_CALIBRATION_SAMPLES)):
+            samples.append(await self._run(_time_hash, BCRYPT_MIN_ROUNDS, timeout=PASSWORD_POOL_START_TIMEOUT))
+        base = sorted(samples)[len(samples) // 2]
+        steps = int(math.floor(math.log2(BCRYPT_TARGET_MS / 1000.0 / base))) if base > 0 else 0
+        self.rounds = max(BCRYPT_MIN_ROUNDS, min(BCRYPT_MAX_ROUNDS, BCRYPT_MIN_ROUNDS + steps))
+        self.calibrated = True
+        self.calibrated_ms = round(base * (2 ** (self.rounds - BCRYPT_MIN_ROUNDS)) * 1000, 1)
+        logger.info("bcrypt maliyeti %s (tahmini %s ms)", self.rounds, self.calibrated_ms)
+        return self.rounds
+
+    async def hash(self, password: str) -> str:
+        started = time.monotonic()
+        result = await self._run(_hash, password, self.rounds)
+        self._record(started)
+        self.hashed += 1
+        return result
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        started = time.monotonic()
+        result = await self._run(_verify, password, hashed)
+        self._record(started)
+        self.verified += 1
+        return result
+
+    def needs_rehash(self, hashed: str) -> bool:
+        rounds = hash_rounds(hashed)
+        if rounds is None:
+            return False
+        if self.calibrated:
+            return rounds < self.rounds
+        return rounds != self.rounds
+
+    def hash_sync(self, password: str) -> str:
+        """
+        Script'ler (seed, bench) için; request yolunda kullanılmaz.
+        """
+        return _hash(password, self.rounds)
+
+    def verify_sync(self, password: str, hashed: str) -> bool:
+        return _verify(password, hashed)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        jobs = self.hashed + self.verified
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "timeout": self.timeout,
+            "rounds": self.rounds,
+            "calibrated": self.calibrated,
+            "calibrated_ms": self.calibrated_ms,
+            "target_ms": BCRYPT_TARGET_MS,
+            "pending": self._pending,
+            "hashed": self.hashed,
+            "verified": self.verified,
+            "rehashed": self.rehashed,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "pool_restarts": self.pool_restarts,
+            "latency_ms_avg": round(self.busy_seconds_total / jobs * 1000, 2) if jobs else 0.0,
+            "latency_ms_max": round(self.latency_seconds_max * 1000, 2),
+        }
+
+
+password_hasher = PasswordHasher(PASSWORD_POOL_WORKERS, PASSWORD_POOL_MAX_QUEUE, PASSWORD_HASH_TIMEOUT)
@@ -0,0 +1,215 @@
+# plans.py
+import os
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal
+from models import Plan
+from scheduler import DEFAULT_PLAN, PLAN_WEIGHTS, USER_INFLIGHT_CAPS, scheduler
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------
+# Plan ayarları (.env ile değiştirilebilir)
+# Limitler plans tablosunda; yeni plan / limit değişikliği deploy gerektirmez.
+# DEFAULT_PLAN scheduler.py'de okunur: yeni kayıtların planı; users.plan tabloda
+# olmayan bir plana düşerse de bu uygulanır.
+# ------------------------------------------------------------
+# Diğer worker'ların yaptığı değişiklikler bu aralıkla fark edilir (tek küçük sorgu)
+PLANS_REFRESH_INTERVAL = float(os.getenv("PLANS_REFRESH_INTERVAL", "30"))
+
+# Tablo boşsa yazılan ilk planlar (eski sabit davranış: free günde 1, pro sınırsız)
+_SEED_PLANS = {
+    "free": {"daily_limit": 1, "monthly_limit": None, "max_batch_items": 100},
+    "pro": {"daily_limit": None, "monthly_limit": None, "max_batch_items": 100},
+}
+
+
+class PlanLimits:
+    """
+    Bir planın cache'teki (salt okunur) hali.
+    """
+
+    __slots__ = (
+        "name",
+        "daily_limit",
+        "monthly_limit",
+        "max_batch_items",
+        "max_concurrency",
+        "priority_weight",
+    )
+
+    def __init__(self, plan: Plan):
+        self.name = plan.name
+        self.daily_limit = plan.daily_limit
+        self.monthly_limit = plan.monthly_limit
+        self.max_batch_items = plan.max_batch_items
+        self.max_concurrency = plan.max_concurrency
+        self.priority_weight = plan.priority_weight
+
+    @property
+    def limited(self) -> bool:
+        return self.daily_limit is not None or self.monthly_limit is not None
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _seed(db) -> None:
+    """
+    Boş tablo açılışta birden fazla worker tarafından aynı anda doldurulabilir;
+    diğeri önce yazdıysa onunki geçerli.
+    """
+    now = datetime.utcnow()
+    for name, limits in _SEED_PLANS.items():
+        db.add(
+            Plan(
+                name=name,
+                max_concurrency=int(USER_INFLIGHT_CAPS.get(name, 1)),
+                priority_weight=PLAN_WEIGHTS.get(name, 1.0),
+                updated_at=now,
+                **limits,
+            )
+        )
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+
+
+def _fingerprint(db) -> tuple:
+    return tuple(db.query(func.count(Plan.name), func.max(Plan.updated_at)).one())
+
+
+class PlanCache:
+    """
+    plans tablosunun process içi kopyası. Kota / batch / scheduler kararları
+    buradan okunur -> istek başına ek DB sorgusu yok.
+    - admin değişikliğinde o worker hemen yeniler
+    - diğer worker'lar PLANS_REFRESH_INTERVAL'da (count, max(updated_at)) değişmişse yeniler
+    """
+
+    def __init__(self):
+        self._plans: dict = {}
+        self._fingerprint: Optional[tuple] = None
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.loaded_at: Optional[datetime] = None
+        # Scheduler sadece event loop içinden değiştirilebilir; load() threadpool'dan
+        # çağrılırsa güncelleme bu loop'a gönderilir (start_refresher'da atanır)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def load(self) -> None:
+        """
+        Bloklayıcı; async koddan threadpool ile çağrılmalı.
+        """
+        with self._lock:
+            db = SessionLocal()
+            try:
+                if not db.query(Plan.name).first():
+                    _seed(db)
+                plans = {plan.name: PlanLimits(plan) for plan in db.query(Plan).all()}
+                fingerprint = _fingerprint(db)
+            finally:
+                db.close()
+
+            # Tek atama: okuyanlar ya eski ya yeni sözlüğü görür
+            self._plans = plans
+            self._fingerprint = fingerprint
+            self.reloads += 1
+            self.loaded_at = datetime.utcnow()
+
+        self._apply_to_scheduler(plans)
+
+    def _apply_to_scheduler(self, plans: dict) -> None:
+        weights = {name: plan.priority_weight for name, plan in plans.items()}
+        user_caps = {name: plan.max_concurrency for name, plan in plans.items()}
+
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            try:
+                on_loop = asyncio.get_running_loop() is loop
+            except RuntimeError:
+                on_loop = False
+            if not on_loop:
+                loop.call_soon_threadsafe(scheduler.set_plan_limits, weights, user_caps)
+                return
+        # Loop'un kendisinden ya da loop başlamadan (import sırasında)
+        scheduler.set_plan_limits(weights, user_caps)
+
+    def refresh_if_changed(self) -> bool:
+        db = SessionLocal()
+        try:
+            fingerprint = _fingerprint(db)
+        finally:
+            db.close()
+        if fingerprint == self._fingerprint:
+            return False
+        self.load()
+        return True
+
+    def get(self, name: Optional[str]) -> PlanLimits:
+        if not self._plans:
+            self.load()
+        plan = self._plans.get(name or DEFAULT_PLAN)
+        if plan is None:
+            # Silinmiş / yazım hatalı plan -> varsayılan plan kuralları
+            plan = self._plans.get(DEFAULT_PLAN) or next(iter(self._plans.values()))
+        return plan
+
+    def exists(self, name: str) -> bool:
+        if not self._plans:
+            self.load()
+        return name in self._plans
+
+    def names(self) -> list:
+        return sorted(self._plans)
+
+    def stats(self) -> dict:
+        return {
+            "plans": {name: plan.as_dict() for name, plan in sorted(self._plans.items())},
+            "default_plan": DEFAULT_PLAN,
+            "reloads": self.reloads,
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+        }
+
+
+plan_cache = PlanCache()
+
+
+# ------------------------------------------------------------
+# Arka plan yenileme (api.py lifespan'inden)
+# ------------------------------------------------------------
+_refresh_task = None
+
+
+async def _refresh_loop() -> None:
+    while True:
+        await asyncio.sleep(PLANS_REFRESH_INTERVAL)
+        try:
+            await run_in_threadpool(plan_cache.refresh_if_changed)
+        except Exception:
+            # Eski limitlerle devam edilir
+            logger.exception("Plan cache yenilenemedi")
+
+
+def start_refresher() -> None:
+    global _refresh_task
+    plan_cache._loop = asyncio.get_running_loop()
+    if PLANS_REFRESH_INTERVAL > 0 and _refresh_task is None:
+        _refresh_task = asyncio.ensure_future(_refresh_loop())
+
+
+def stop_refresher() -> None:
+    global _refresh_task
+    plan_cache._loop = None
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        _refresh_task = None
@@ -0,0 +1,280 @@
+# quota.py
+import asyncio
+import logging
+from datetime import date
+from typing import Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, case, func, inspect, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal
+from models import User, CaptionUsage
+from plans import PlanLimits, plan_cache
+from quota_counters import QUOTA_FLUSH_INTERVAL, quota_counters
+
+logger = logging.getLogger(__name__)
+
+# Günlük / aylık limitler plans tablosundan (plans.py cache'i) okunur
+_USAGE_UNIQUE_INDEX = "uq_caption_usages_user_date"
+
+
+# ------------------------------------------------------------
+# Şema: (user_id, date) tekil olmalı (eski DB'ler için tek seferlik)
+# ------------------------------------------------------------
+def ensure_usage_index(engine: Engine) -> None:
+    """
+    create_all var olan tabloya index eklemez. Eski caption.db'de aynı gün için
+    birden fazla satır olabilir: sayıları ilk satırda toplayıp gerisini sil, sonra
+    unique index'i oluştur.
+    """
+    existing = {ix["name"] for ix in inspect(engine).get_indexes(CaptionUsage.__tablename__)}
+    if _USAGE_UNIQUE_INDEX in existing:
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            """
+            UPDATE caption_usages
+            SET count = (
+                SELECT SUM(c2.count) FROM caption_usages c2
+                WHERE c2.user_id = caption_usages.user_id AND c2.date = caption_usages.date
+            )
+            WHERE id IN (
+                SELECT MIN(id) FROM caption_usages GROUP BY user_id, date HAVING COUNT(*) > 1
+            )
+            """
+        ))
+        conn.execute(text(
+            """
+            DELETE FROM caption_usages
+            WHERE id NOT IN (SELECT MIN(id) FROM caption_usages GROUP BY user_id, date)
+            """
+        ))
+        conn.execute(text(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {_USAGE_UNIQUE_INDEX} "
+            "ON caption_usages (user_id, date)"
+        ))
+
+
+# ------------------------------------------------------------
+# DB helpers (threadpool içinde çalışır, event loop'u bloklamaz)
+# ------------------------------------------------------------
+def _insert(db: Session):
+    # ON CONFLICT ... DO UPDATE ... WHERE sözdizimi SQLite ve Postgres'te aynı
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(CaptionUsage.__table__)
+
+
+def _try_increment(
+    db: Session,
+    user_id: int,
+    today: date,
+    amount: int,
+    daily_limit: Optional[int],
+    monthly_limit: Optional[int] = None,
+) -> Optional[str]:
+    """
+    Kontrol + artırma tek statement:
+      INSERT ... ON CONFLICT (user_id, date) DO UPDATE SET count = count + :amount
+      WHERE count + :amount <= :daily [AND (ayın toplamı) + :amount <= :monthly] RETURNING count
+    Koşul tutmazsa satır dönmez -> limit dolu. Paralel istekler (farklı worker'lar dahil)
+    limiti aşamaz, uygulama tarafında kilit gerekmez.
+    Günün ilk satırı INSERT ile açılır; o yol için aylık toplam önce okunur
+    (aynı gün ikinci istek zaten conflict'e düşüp WHERE'den geçer).
+    Limit içindeyse None, değilse aşılan limit ("daily" / "monthly") döner.
+    """
+    if daily_limit is not None and amount > daily_limit:
+        return "daily"
+
+    table = CaptionUsage.__table__
+    month_total = None
+    if monthly_limit is not None:
+        month_usage = table.alias("month_usage")
+        month_total = (
+            select(func.coalesce(func.sum(month_usage.c.count), 0))
+            .where(
+                month_usage.c.user_id == user_id,
+                month_usage.c.date >= today.replace(day=1),
+                month_usage.c.date <= today,
+            )
+            .scalar_subquery()
+        )
+        if db.execute(select(month_total)).scalar() + amount > monthly_limit:
+            return "monthly"
+
+    conditions = []
+    if daily_limit is not None:
+        conditions.append(table.c.count + amount <= daily_limit)
+    if month_total is not None:
+        conditions.append(month_total + amount <= monthly_limit)
+
+    stmt = (
+        _insert(db)
+        .values(user_id=user_id, date=today, count=amount)
+        .on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.date],
+            set_={"count": table.c.count + amount},
+            where=and_(*conditions),
+        )
+        .returning(table.c.count)
+    )
+    row = db.execute(stmt).first()
+    db.commit()
+    if row is not None:
+        return None
+
+    count = db.execute(
+        select(table.c.count).where(table.c.user_id == user_id, table.c.date == today)
+    ).scalar() or 0
+    return "daily" if daily_limit is not None and count + amount > daily_limit else "monthly"
+
+
+def _write_usages(rows: list) -> None:
+    """
+    Sayaç değerlerini caption_usages'a mutlak olarak yazar (tekrar yazmak zararsız).
+    """
+    table = CaptionUsage.__table__
+    db = SessionLocal()
+    try:
+        for user_id, day, count in rows:
+            stmt = _insert(db).values(user_id=user_id, date=day, count=count)
+            db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[table.c.user_id, table.c.date],
+                    set_={"count": stmt.excluded.count},
+                )
+            )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _load_usages(since: date) -> list:
+    table = CaptionUsage.__table__
+    db = SessionLocal()
+    try:
+        return [
+            tuple(row)
+            for row in db.execute(
+                table.select().with_only_columns(table.c.user_id, table.c.date, table.c.count)
+                .where(table.c.date >= since)
+            )
+        ]
+    finally:
+        db.close()
+
+
+def _decrement(db: Session, user_id: int, today: date, amount: int) -> None:
+    table = CaptionUsage.__table__
+    db.execute(
+        table.update()
+        .where(table.c.user_id == user_id, table.c.date == today, table.c.count > 0)
+        .values(count=case((table.c.count > amount, table.c.count - amount), else_=0))
+    )
+    db.commit()
+
+
+# ------------------------------------------------------------
+# Public API -> api.py burayı kullanıyor
+# ------------------------------------------------------------
+def _limit_message(plan: PlanLimits, exceeded: str) -> str:
+    if exceeded == "monthly":
+        return f"{plan.name} planinda ayda {plan.monthly_limit} caption uretebilirsin. Daha fazlasi icin planini yukselt."
+    return f"{plan.name} planinda gunde {plan.daily_limit} caption uretebilirsin. Daha fazlasi icin planini yukselt."
+
+
+async def reserve(db: Session, user: User, amount: int = 1) -> Optional[date]:
+    """
+    LLM çağrısından ÖNCE kullanım hakkı ayırır (batch için amount > 1).
+    - limitli plan (günlük / aylık): limit dolmuşsa 403 fırlatır, değilse sayacı
+      artırıp hakkın düştüğü günü döner.
+    - limitsiz plan: hiçbir şey yapmaz, None döner (release gerekmez).
+    Üretim başarısız olursa release() ile hak geri verilmeli.
+    """
+    plan = plan_cache.get(user.plan)
+    if not plan.limited:
+        return None
+
+    today = date.today()
+    if quota_counters is not None:
+        exceeded = await run_in_threadpool(
+            quota_counters.try_increment, user.id, today, amount, plan.daily_limit, plan.monthly_limit
+        )
+    else:
+        exceeded = await run_in_threadpool(
+            _try_increment, db, user.id, today, amount, plan.daily_limit, plan.monthly_limit
+        )
+
+    if exceeded is not None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=_limit_message(plan, exceeded),
+        )
+    return today
+
+
+async def release(db: Session, user_id: int, reserved_on: Optional[date], amount: int = 1) -> None:
+    """
+    reserve() ile ayrılan hakkı geri verir (üretim başarısız olduysa).
+    """
+    if reserved_on is None or amount <= 0:
+        return
+
+    if quota_counters is not None:
+        await run_in_threadpool(quota_counters.decrement, user_id, reserved_on, amount)
+    else:
+        await run_in_threadpool(_decrement, db, user_id, reserved_on, amount)
+
+
+# ------------------------------------------------------------
+# Write-behind: sayaçlar -> caption_usages (api.py lifespan'inden)
+# ------------------------------------------------------------
+_flush_task = None
+
+
+def load_counters() -> None:
+    """
+    Açılışta bu ayın kullanımını tablodan sayaçlara yükler (restart limiti sıfırlamasın).
+    """
+    if quota_counters is not None:
+        quota_counters.load(_load_usages(date.today().replace(day=1)))
+
+
+def flush_counters() -> int:
+    if quota_counters is None:
+        return 0
+    # Aylık limit için ayın başından beri tutulur
+    return quota_counters.flush(_write_usages, keep_from=date.today().replace(day=1))
+
+
+async def _flush_loop() -> None:
+    while True:
+        await asyncio.sleep(QUOTA_FLUSH_INTERVAL)
+        try:
+            await run_in_threadpool(flush_counters)
+        except Exception:
+            # Satırlar dirty kalır, bir sonraki turda tekrar denenir
+            logger.exception("Kota sayaclari caption_usages'a yazilamadi")
+
+
+def start_flusher() -> None:
+    global _flush_task
+    if quota_counters is not None and _flush_task is None:
+        _flush_task = asyncio.ensure_future(_flush_loop())
+
+
+async def stop_flusher() -> None:
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        _flush_task = None
+    # Kapanışta son değerler kaybolmasın
+    await run_in_threadpool(flush_counters)
+
+
+def stats() -> Optional[dict]:
+    return quota_counters.stats() if quota_counters is not None else None
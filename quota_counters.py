@@ -0,0 +1,236 @@
+# quota_counters.py
+import os
+import sqlite3
+import threading
+from datetime import date
+from typing import Callable, Optional
+
+# ------------------------------------------------------------
+# Günlük hak sayaçları (.env ile değiştirilebilir)
+# caption.db'ye her istekte iki yazma yerine sayaçlar küçük, ayrı bir WAL
+# dosyasında tutulur; caption_usages'a toplu olarak (write-behind) yazılır.
+# ------------------------------------------------------------
+QUOTA_COUNTERS_ENABLED = os.getenv("QUOTA_COUNTERS_ENABLED", "1") == "1"
+QUOTA_COUNTERS_PATH = os.getenv("QUOTA_COUNTERS_PATH", "./quota_counters.db")
+# caption_usages'a bu aralıkla yazılır (kapanışta da)
+QUOTA_FLUSH_INTERVAL = float(os.getenv("QUOTA_FLUSH_INTERVAL", "5"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quota_counters (
+    user_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    dirty INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+"""
+
+
+class QuotaCounters:
+    """
+    (user_id, gün) -> kullanılan hak. Tek dosya, WAL + mmap: aynı makinedeki tüm
+    uvicorn worker'ları aynı sayacı görür, yazmalar fsync beklemez.
+    - kontrol + artırma tek statement (limit aşılamaz)
+    - değişen satırlar dirty işaretlenir, flush edilince temizlenir
+    - açılışta caption_usages'tan yüklenir (MAX ile: hangisi ilerideyse o geçerli)
+    - aylık limit için ayın günleri tutulur, daha eskiler flush'ta silinir
+    Metodlar bloklayıcıdır; async koddan threadpool ile çağrılmalı.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+        self.reserved = 0
+        self.rejected = 0
+        self.released = 0
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.flush_errors = 0
+
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+
+    # ---------- bağlantı (thread başına bir tane) ----------
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("PRAGMA mmap_size=8388608")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    # ---------- hak ayırma / iade ----------
+    def try_increment(
+        self,
+        user_id: int,
+        day: date,
+        amount: int,
+        daily_limit: Optional[int],
+        monthly_limit: Optional[int] = None,
+    ) -> Optional[str]:
+        """
+        Limit içindeyse sayacı artırır ve None döner; aşılıyorsa "daily" / "monthly".
+        Sadece günlük limit varsa tek statement; aylık limitte toplam aynı yazma
+        kilidi altında okunur (BEGIN IMMEDIATE) -> worker'lar arası yine atomik.
+        """
+        if daily_limit is not None and amount > daily_limit:
+            self._count("rejected")
+            return "daily"
+
+        conn = self._conn()
+        if monthly_limit is None:
+            row = conn.execute(
+                """
+                INSERT INTO quota_counters (user_id, day, count, dirty) VALUES (?, ?, ?, 1)
+                ON CONFLICT(user_id, day) DO UPDATE SET count = count + excluded.count, dirty = 1
+                WHERE count + excluded.count <= ?
+                RETURNING count
+                """,
+                (user_id, day.isoformat(), amount, daily_limit),
+            ).fetchone()
+            exceeded = None if row is not None else "daily"
+        else:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                today_count, month_count = conn.execute(
+                    """
+                    SELECT COALESCE(SUM(CASE WHEN day = ? THEN count END), 0), COALESCE(SUM(count), 0)
+                    FROM quota_counters WHERE user_id = ? AND day >= ? AND day <= ?
+                    """,
+                    (day.isoformat(), user_id, day.replace(day=1).isoformat(), day.isoformat()),
+                ).fetchone()
+                if daily_limit is not None and today_count + amount > daily_limit:
+                    exceeded = "daily"
+                elif month_count + amount > monthly_limit:
+                    exceeded = "monthly"
+                else:
+                    exceeded = None
+                    conn.execute(
+                        """
+                        INSERT INTO quota_counters (user_id, day, count, dirty) VALUES (?, ?, ?, 1)
+                        ON CONFLICT(user_id, day) DO UPDATE SET count = count + excluded.count, dirty = 1
+                        """,
+                        (user_id, day.isoformat(), amount),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+        self._count("reserved" if exceeded is None else "rejected")
+        return exceeded
+
+    def decrement(self, user_id: int, day: date, amount: int) -> None:
+        self._conn().execute(
+            """
+            UPDATE quota_counters SET count = MAX(count - ?, 0), dirty = 1
+            WHERE user_id = ? AND day = ? AND count > 0
+            """,
+            (amount, user_id, day.isoformat()),
+        )
+        self._count("released")
+
+    # ---------- caption_usages ile senkron ----------
+    def load(self, rows: list) -> None:
+        """
+        rows: [(user_id, gün, count), ...] (caption_usages'tan).
+        Sayaç dosyası flush'tan önce çöken bir process yüzünden ileride olabilir,
+        silinmişse tablo ileridedir; ikisinin büyüğü alınır -> restart limiti sıfırlamaz.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                """
+                INSERT INTO quota_counters (user_id, day, count, dirty) VALUES (?, ?, ?, 0)
+                ON CONFLICT(user_id, day) DO UPDATE SET
+                    count = MAX(count, excluded.count),
+                    dirty = CASE WHEN count > excluded.count THEN 1 ELSE dirty END
+                """,
+                [(user_id, day.isoformat(), count) for user_id, day, count in rows],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def flush(self, write: Callable[[list], None], keep_from: Optional[date] = None) -> int:
+        """
+        Değişen satırları write([(user_id, gün, count), ...]) ile kalıcı tabloya yazar.
+        caption.db'ye yazarken sayaç dosyasında kilit tutulmaz (hak ayırma beklemesin):
+          1) dirty satırlar okunur
+          2) kilitsiz yazılır
+          3) satır, sayaç hâlâ yazılan değerdeyse temizlenir; değilse dirty kalır
+             (arada artmış ya da başka worker'ın flush'ı eski değeri sonradan yazmış
+             olabilir -> bir sonraki flush güncel değeri tekrar yazar)
+        keep_from'dan eski, yazılmış günler silinir.
+        """
+        conn = self._conn()
+        rows = [
+            (user_id, date.fromisoformat(day), count)
+            for user_id, day, count in conn.execute(
+                "SELECT user_id, day, count FROM quota_counters WHERE dirty = 1"
+            ).fetchall()
+        ]
+
+        try:
+            if rows:
+                write(rows)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    """
+                    UPDATE quota_counters SET dirty = CASE WHEN count = ? THEN 0 ELSE 1 END
+                    WHERE user_id = ? AND day = ?
+                    """,
+                    [(count, user_id, day.isoformat()) for user_id, day, count in rows],
+                )
+                if keep_from is not None:
+                    conn.execute(
+                        "DELETE FROM quota_counters WHERE day < ? AND dirty = 0", (keep_from.isoformat(),)
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except BaseException:
+            self._count("flush_errors")
+            raise
+
+        self._count("flushes")
+        self._count("flushed_rows", len(rows))
+        return len(rows)
+
+    def stats(self) -> dict:
+        try:
+            conn = self._conn()
+            entries = conn.execute("SELECT COUNT(*) FROM quota_counters").fetchone()[0]
+            dirty = conn.execute("SELECT COUNT(*) FROM quota_counters WHERE dirty = 1").fetchone()[0]
+        except sqlite3.Error:
+            entries = dirty = None
+
+        return {
+            "path": self.path,
+            "entries": entries,
+            "dirty": dirty,
+            "flush_interval": QUOTA_FLUSH_INTERVAL,
+            # Aşağıdakiler bu process'e ait sayaçlar
+            "reserved": self.reserved,
+            "rejected": self.rejected,
+            "released": self.released,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "flush_errors": self.flush_errors,
+        }
+
+
+quota_counters = QuotaCounters(QUOTA_COUNTERS_PATH) if QUOTA_COUNTERS_ENABLED else None
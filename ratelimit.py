@@ -0,0 +1,187 @@
+# ratelimit.py
+import os
+import re
+import time
+import asyncio
+from typing import Optional
+
+from scheduler import Overloaded
+
+
+# ------------------------------------------------------------
+# Upstream rate limit ayarları (.env ile değiştirilebilir)
+# Başlangıç değerleri; ilk cevaptaki x-ratelimit-* header'ları gelince onlar esas alınır.
+# ------------------------------------------------------------
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "500"))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "200000"))
+# Bütçe için bu kadardan uzun beklenecekse istek hiç gönderilmez -> 429
+LLM_THROTTLE_MAX_WAIT = float(os.getenv("LLM_THROTTLE_MAX_WAIT", "10"))
+# Cevap uzunluğu baştan bilinmiyor; token bütçesinden bu kadar ayrılır, sonra usage ile düzeltilir
+LLM_EST_COMPLETION_TOKENS = int(os.getenv("LLM_EST_COMPLETION_TOKENS", "300"))
+
+# "6m0s", "1.5s", "20ms" -> saniye
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNIT_SECONDS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def parse_reset(raw: Optional[str]) -> Optional[float]:
+    if not raw:
+        return None
+    parts = _DURATION_PART.findall(raw)
+    if not parts:
+        return None
+    return sum(float(value) * _UNIT_SECONDS[unit] for value, unit in parts)
+
+
+def estimate_prompt_tokens(messages: list) -> int:
+    """
+    Kaba tahmin: ~4 karakter = 1 token, mesaj başına birkaç token ek yük.
+    """
+    chars = sum(len(m.get("content") or "") for m in messages)
+    return chars // 4 + 4 * len(messages)
+
+
+class _Bucket:
+    """
+    Dakikalık limit için token bucket.
+    level eksiye düşebilir: eksi kısım, sıradaki isteklerin bekleyeceği süredir.
+    """
+
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / 60.0
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        deficit = amount - self.level
+        return deficit / self.rate if deficit > 0 else 0.0
+
+    def sync(self, limit: Optional[int], remaining: Optional[int]) -> None:
+        """
+        Sunucu header'larıyla düzelt. Aynı key'i başka process'ler de kullanıyor olabilir,
+        o yüzden sadece aşağı çekilir; yukarı doğru zaten refill ile toparlanır.
+        """
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            self.level = min(self.level, float(remaining))
+
+
+class UpstreamRateLimiter:
+    """
+    OpenAI'ye gitmeden önce RPM / TPM bütçesini yerelde tutar.
+    - acquire(): bütçe yoksa yetene kadar bekler; bekleme max_wait'ten uzunsa Overloaded.
+    - sync_headers(): her cevaptaki x-ratelimit-remaining-* / reset değerleriyle düzeltir.
+    - settle(): tahmini token ile gerçek usage arasındaki farkı geri yazar.
+    Sadece event loop içinden kullanılıyor, kilit gerekmez.
+    """
+
+    def __init__(self, rpm: int, tpm: int, max_wait: float):
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.max_wait = max_wait
+        self._blocked_until = 0.0  # upstream 429 verdiyse reset'e kadar kimse gitmesin
+
+        self.throttled = 0
+        self.throttle_seconds_total = 0.0
+        self.throttle_seconds_max = 0.0
+        self.shed = 0
+        self.upstream_429 = 0
+        self.header_updates = 0
+
+    def _refill(self) -> float:
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        return now
+
+    def wait_estimate(self, estimated_tokens: int) -> float:
+        """
+        Bu istek şimdi gelse bütçe için kaç saniye bekler (key seçiminde kullanılıyor).
+        """
+        now = self._refill()
+        return max(
+            0.0,
+            self.requests.wait_for(1),
+            self.tokens.wait_for(estimated_tokens),
+            self._blocked_until - now,
+        )
+
+    async def acquire(self, estimated_tokens: int) -> None:
+        wait = self.wait_estimate(estimated_tokens)
+
+        if wait > self.max_wait:
+            self.shed += 1
+            raise Overloaded(int(wait) + 1, "upstream_rate_limit")
+
+        # Bütçeyi şimdi ayır (eksiye düşebilir) -> sonraki gelen daha uzun bekler, sıra korunur
+        self.requests.level -= 1
+        self.tokens.level -= estimated_tokens
+
+        if wait > 0:
+            self.throttled += 1
+            self.throttle_seconds_total += wait
+            self.throttle_seconds_max = max(self.throttle_seconds_max, wait)
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        if actual_tokens is not None:
+            self.tokens.level += estimated_tokens - actual_tokens
+
+    def sync_headers(self, headers) -> None:
+        def as_int(name: str) -> Optional[int]:
+            value = headers.get(name)
+            try:
+                return int(value) if value is not None else None
+            except ValueError:
+                return None
+
+        if headers.get("x-ratelimit-remaining-requests") is None and headers.get("x-ratelimit-remaining-tokens") is None:
+            return
+
+        self._refill()
+        self.requests.sync(as_int("x-ratelimit-limit-requests"), as_int("x-ratelimit-remaining-requests"))
+        self.tokens.sync(as_int("x-ratelimit-limit-tokens"), as_int("x-ratelimit-remaining-tokens"))
+        self.header_updates += 1
+
+    def on_rate_limited(self, headers) -> None:
+        """
+        Upstream yine de 429 verdi: bütçeyi sıfırla, reset süresi boyunca yeni istek gönderme.
+        """
+        self.upstream_429 += 1
+        self._refill()
+        self.sync_headers(headers)
+
+        resets = [
+            parse_reset(headers.get("x-ratelimit-reset-requests")),
+            parse_reset(headers.get("x-ratelimit-reset-tokens")),
+        ]
+        retry_after = headers.get("retry-after")
+        if retry_after and retry_after.replace(".", "", 1).isdigit():
+            resets.append(float(retry_after))
+        pause = max([r for r in resets if r is not None] or [1.0])
+        self._blocked_until = max(self._blocked_until, time.monotonic() + pause)
+
+    def stats(self) -> dict:
+        self._refill()
+        return {
+            "rpm_limit": int(self.requests.capacity),
+            "tpm_limit": int(self.tokens.capacity),
+            "remaining_requests": round(self.requests.level, 1),
+            "remaining_tokens": round(self.tokens.level, 1),
+            "blocked_for_seconds": round(max(0.0, self._blocked_until - time.monotonic()), 3),
+            "throttled": self.throttled,
+            "throttle_seconds_total": round(self.throttle_seconds_total, 3),
+            "throttle_seconds_max": round(self.throttle_seconds_max, 3),
+            "shed": self.shed,
+            "upstream_429": self.upstream_429,
+            "header_updates": self.header_updates,
+        }
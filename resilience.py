@@ -0,0 +1,302 @@
+# resilience.py
+import os
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+import openai
+
+from scheduler import Overloaded
+
+
+# ------------------------------------------------------------
+# Upstream dayanıklılık ayarları (.env ile değiştirilebilir)
+# ------------------------------------------------------------
+# Tek denemenin süresi (stream'de: ilk token'a kadar geçen süre)
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "30"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.2"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "2.0"))
+# Retry bütçesi: her çağrı RATIO kadar hak biriktirir, her retry / hedge 1 harcar
+LLM_RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.1"))
+LLM_RETRY_BUDGET_MAX = float(os.getenv("LLM_RETRY_BUDGET_MAX", "10"))
+# Art arda bu kadar hata -> devre açılır, COOLDOWN boyunca istek gönderilmez
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# Hedging: ilk deneme p95 süresinde sonuç / ilk token vermezse ikinci istek gönderilir
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "0") == "1"
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.05"))
+
+# Tekrar denemeye değer hatalar (upstream geçici olarak sorunlu)
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APIConnectionError,  # APITimeoutError da bunun alt sınıfı
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class CircuitOpen(Overloaded):
+    """
+    Upstream art arda hata verdi; cooldown bitene kadar istek gönderilmiyor -> 503.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__(retry_after, "circuit_open")
+
+
+class RetryBudget:
+    """
+    Retry'ların toplam trafiğin belli bir oranını geçmemesi için.
+    Upstream çökünce her istek 3 kez denenip yükü 3'e katlamasın.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.exhausted = 0
+
+    def deposit(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.exhausted += 1
+        return False
+
+
+class CircuitBreaker:
+    """
+    closed -> (art arda N hata) -> open -> (cooldown) -> half_open -> tek deneme
+    başarılıysa closed, değilse tekrar open.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        self.opened = 0
+        self.rejected = 0
+
+    def _retry_after(self) -> int:
+        return max(1, int(self._opened_at + self.cooldown - time.monotonic()) + 1)
+
+    def before_call(self) -> bool:
+        """
+        Çağrıya izin var mı bakar; yoksa CircuitOpen fırlatır.
+        half_open deneme çağrısıysa True döner (sonucu after_call ile bildirilmeli).
+        """
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.cooldown:
+                self.rejected += 1
+                raise CircuitOpen(self._retry_after())
+            self.state = "half_open"
+
+        if self.state == "half_open":
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpen(1)
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def after_call(self, probe: bool, healthy: Optional[bool]) -> None:
+        """
+        healthy: True başarı, False upstream hatası, None sonuç yok (iptal / upstream dışı hata).
+        """
+        if probe:
+            self._probe_in_flight = False
+
+        if healthy is True:
+            self.state = "closed"
+            self.consecutive_failures = 0
+        elif healthy is False:
+            self.consecutive_failures += 1
+            if probe or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opened += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+        # None: half_open'da kalır, bir sonraki istek tekrar dener
+
+
+class _LatencyWindow:
+    def __init__(self, size: int = 500):
+        self.samples: deque = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class UpstreamGuard:
+    """
+    Tek bir upstream çağrısını (attempt) saran katman:
+    - deneme başına timeout
+    - jitter'lı retry (RetryBudget sınırında)
+    - circuit breaker (upstream çökükken hızlı hata)
+    - opsiyonel hedging: deneme p95'te bitmezse ikinci istek, ilk biten kazanır
+    attempt() her çağrıda yeni bir istek başlatmalı. discard(result), hedge yarışını
+    kaybeden ama yine de sonuç üretmiş denemenin kaynağını (ör. açık stream) kapatır.
+    """
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN)
+        self.budget = RetryBudget(LLM_RETRY_BUDGET_RATIO, LLM_RETRY_BUDGET_MAX)
+        self.attempt_timeout = LLM_ATTEMPT_TIMEOUT
+        self.max_attempts = LLM_MAX_ATTEMPTS
+        self.hedge_enabled = LLM_HEDGE_ENABLED
+        self._latency: dict = {}  # kind -> _LatencyWindow
+
+        self.calls = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def _window(self, kind: str) -> _LatencyWindow:
+        window = self._latency.get(kind)
+        if window is None:
+            window = self._latency[kind] = _LatencyWindow()
+        return window
+
+    def hedge_delay(self, kind: str) -> Optional[float]:
+        window = self._window(kind)
+        if not self.hedge_enabled or len(window.samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return max(LLM_HEDGE_MIN_DELAY, window.percentile(95))
+
+    def _backoff(self, attempt_no: int) -> float:
+        # Full jitter: aynı anda düşen istekler aynı anda geri gelmesin
+        return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** (attempt_no - 1)))
+
+    async def run(
+        self,
+        attempt: Callable[[], Awaitable],
+        kind: str = "complete",
+        discard: Optional[Callable[[object], Awaitable]] = None,
+    ):
+        self.calls += 1
+        self.budget.deposit()
+        attempt_no = 0
+
+        while True:
+            attempt_no += 1
+            probe = self.breaker.before_call()
+            healthy = None
+            try:
+                result, latency = await self._attempt(attempt, kind, discard)
+                healthy = True
+            except RETRYABLE_ERRORS as exc:
+                if isinstance(exc, asyncio.TimeoutError):
+                    self.timeouts += 1
+                # 429 upstream'in çöktüğünü göstermez, devreyi açmasın
+                healthy = None if isinstance(exc, openai.RateLimitError) else False
+                self.failures += 1
+                if attempt_no >= self.max_attempts or not self.budget.withdraw():
+                    raise
+            finally:
+                self.breaker.after_call(probe, healthy)
+
+            if healthy:
+                self._window(kind).add(latency)
+                return result
+
+            self.retries += 1
+            await asyncio.sleep(self._backoff(attempt_no))
+
+    async def _timed(self, attempt):
+        # Kazanan denemenin kendi süresi; hedge beklemesi p95'i şişirmesin
+        started = time.monotonic()
+        result = await asyncio.wait_for(attempt(), self.attempt_timeout)
+        return result, time.monotonic() - started
+
+    async def _attempt(self, attempt, kind: str, discard):
+        """
+        (sonuç, süre) döner.
+        """
+        primary = asyncio.ensure_future(self._timed(attempt))
+        delay = self.hedge_delay(kind)
+        if delay is None:
+            return await primary
+
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        except BaseException:
+            primary.cancel()
+            raise
+        if done or not self.budget.withdraw():
+            return await primary
+
+        self.hedged += 1
+        hedge = asyncio.ensure_future(self._timed(attempt))
+        pending = {primary, hedge}
+        winner = None
+        error = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and winner is None:
+                        winner = task
+                    elif task.exception() is not None:
+                        error = task.exception()
+                    elif discard is not None:
+                        # İkisi aynı anda bitti -> kaybedenin kaynağını kapat
+                        await discard(task.result()[0])
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if winner is None:
+            raise error
+        if winner is hedge:
+            self.hedge_wins += 1
+        return winner.result()
+
+    def stats(self) -> dict:
+        latency = {
+            kind: {
+                "p50_ms": round(window.percentile(50) * 1000, 1),
+                "p95_ms": round(window.percentile(95) * 1000, 1),
+                "p99_ms": round(window.percentile(99) * 1000, 1),
+                "samples": len(window.samples),
+            }
+            for kind, window in self._latency.items()
+            if window.samples
+        }
+        return {
+            "breaker_state": self.breaker.state,
+            "breaker_opened": self.breaker.opened,
+            "breaker_rejected": self.breaker.rejected,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "calls": self.calls,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "retry_budget": round(self.budget.tokens, 2),
+            "retry_budget_exhausted": self.budget.exhausted,
+            "hedge_enabled": self.hedge_enabled,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "latency": latency,
+        }
+
+
+upstream_guard = UpstreamGuard()
@@ -0,0 +1,346 @@
+# scheduler.py
+import os
+import math
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+
+def _parse_plan_map(raw: str) -> dict:
+    """
+    "pro:4,free:1" -> {"pro": 4.0, "free": 1.0}
+    """
+    result = {}
+    for part in raw.split(","):
+        if ":" in part:
+            name, value = part.split(":", 1)
+            result[name.strip()] = float(value)
+    return result
+
+
+# ------------------------------------------------------------
+# Scheduler ayarları (.env ile değiştirilebilir)
+# ------------------------------------------------------------
+# Aynı anda LLM'e gidebilecek toplam istek
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "64"))
+# Sırada bekleyebilecek toplam istek; doluysa yeni istek hemen 429 alır
+SCHEDULER_MAX_QUEUE = int(os.getenv("SCHEDULER_MAX_QUEUE", "256"))
+# Sırada en fazla bu kadar beklenir, sonra 429
+SCHEDULER_QUEUE_TIMEOUT = float(os.getenv("SCHEDULER_QUEUE_TIMEOUT", "20"))
+# Tek kullanıcı sıranın en fazla 1/N'ini tutabilir (4 -> max_queue'nun dörtte biri)
+SCHEDULER_USER_QUEUE_SHARE = int(os.getenv("SCHEDULER_USER_QUEUE_SHARE", "4"))
+# Plan ağırlıkları: yoğunlukta pro, free'ye göre 4 kat sık sıra alır
+PLAN_WEIGHTS = _parse_plan_map(os.getenv("PLAN_WEIGHTS", "pro:4,free:1"))
+# Kullanıcı başına aynı anda LLM'de olabilecek istek sayısı
+USER_INFLIGHT_CAPS = _parse_plan_map(os.getenv("USER_INFLIGHT_CAPS", "pro:4,free:1"))
+DEFAULT_WEIGHT = 1.0
+# Yeni kayıtların planı; plan bilgisi olmayan istekler de bu planın kuyruğuna girer
+# (plans.py buradan alır: plans -> scheduler import yönü)
+DEFAULT_PLAN = os.getenv("DEFAULT_PLAN", "free")
+DEFAULT_USER_INFLIGHT_CAP = 1
+
+# Retry-After hesabı için başlangıç tahmini (gerçek süreler geldikçe EWMA ile güncellenir)
+_INITIAL_SERVICE_SECONDS = 5.0
+_MAX_RETRY_AFTER = 60
+
+
+class Overloaded(Exception):
+    """
+    Upstream önündeki sıra dolu ya da beklerken süre doldu -> 429 + Retry-After.
+    """
+
+    def __init__(self, retry_after: int, reason: str = "queue_full"):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ("user_id", "plan", "future", "enqueued_at", "granted_at")
+
+    def __init__(self, user_id: int, plan: str, future: asyncio.Future):
+        self.user_id = user_id
+        self.plan = plan
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.granted_at = 0.0
+
+
+class _PlanLane:
+    """
+    Bir planın kuyruğu: kullanıcı başına deque, kullanıcılar arasında round-robin.
+    """
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.pass_value = 0.0  # stride scheduling: küçük olan sıradaki
+        self.users: "OrderedDict[int, deque]" = OrderedDict()
+        self.queued = 0
+
+        self.granted = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.recent_waits: deque = deque(maxlen=1000)
+
+    def record_wait(self, seconds: float) -> None:
+        self.granted += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+        self.recent_waits.append(seconds)
+
+
+class FairScheduler:
+    """
+    LLM çağrısı önünde ağırlıklı adil sıralayıcı + admission control.
+    - Planlar arası: stride scheduling (ağırlık oranında sıra).
+    - Plan içinde: kullanıcılar arası round-robin (tek kullanıcı kuyruğu tıkayamaz).
+    - Kullanıcı başına in-flight sınırı: sınırdaki kullanıcının işi, slot boşalana kadar atlanır.
+    - Toplam sıra max_queue ile sınırlı; doluysa veya queue_timeout aşılırsa Overloaded.
+    Sadece event loop içinden kullanılıyor, kilit gerekmez.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        weights: dict,
+        user_caps: dict,
+        max_queue: int,
+        queue_timeout: float,
+    ):
+        self.max_concurrency = max_concurrency
+        self.weights = weights
+        self.user_caps = user_caps
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._active = 0
+        self._queued = 0
+        self._lanes: dict = {}
+        self._user_inflight: dict = {}
+        self._virtual_time = 0.0
+        self._service_seconds = _INITIAL_SERVICE_SECONDS  # slot tutma süresi (EWMA)
+
+        self.rejected_queue_full = 0
+        self.rejected_user_queue_full = 0
+        self.rejected_timeout = 0
+
+    def _lane(self, plan: str) -> _PlanLane:
+        lane = self._lanes.get(plan)
+        if lane is None:
+            lane = _PlanLane(self.weights.get(plan, DEFAULT_WEIGHT))
+            self._lanes[plan] = lane
+        return lane
+
+    def _user_cap(self, plan: str) -> int:
+        return int(self.user_caps.get(plan, DEFAULT_USER_INFLIGHT_CAP))
+
+    # ---------- public ----------
+    def retry_after(self) -> int:
+        """
+        Sıradakilerin erimesi için tahmini süre (saniye).
+        """
+        estimate = self._service_seconds * (self._queued + 1) / max(self.max_concurrency, 1)
+        return max(1, min(_MAX_RETRY_AFTER, math.ceil(estimate)))
+
+    def check_admission(self, user_id: Optional[int] = None, plan: Optional[str] = None) -> None:
+        """
+        Sıra doluysa hemen Overloaded fırlatır (stream başlamadan 429 dönebilmek için).
+        Boş global slot olsa da sıra sınırı geçerli: kendi in-flight sınırında bekleyen
+        işler de sırada yer tutar. Kullanıcı başına da en fazla max_queue / SCHEDULER_USER_QUEUE_SHARE
+        iş beklenebilir (tek kullanıcı sırayı dolduramaz).
+        """
+        # max_queue=0: boş slot varken kabul, yoksa hiç bekletme
+        if self._queued >= self.max_queue and (self._queued or self._active >= self.max_concurrency):
+            self.rejected_queue_full += 1
+            raise Overloaded(self.retry_after(), "queue_full")
+        if user_id is not None and self._user_queued(user_id, plan) >= self._user_queue_limit():
+            self.rejected_user_queue_full += 1
+            raise Overloaded(self.retry_after(), "user_queue_full")
+
+    async def acquire(self, user_id: int, plan: str) -> _Waiter:
+        self.check_admission(user_id, plan)
+
+        lane = self._lane(plan)
+        if lane.queued == 0:
+            # Boştan dönen plan geçmişteki boşluğu "kredi" olarak kullanamasın
+            lane.pass_value = max(lane.pass_value, self._virtual_time)
+
+        waiter = _Waiter(user_id, plan, asyncio.get_running_loop().create_future())
+        lane.users.setdefault(user_id, deque()).append(waiter)
+        lane.queued += 1
+        self._queued += 1
+        self._dispatch()
+
+        try:
+            # shield: timeout future'ı iptal etmesin, kuyruktan kendimiz çıkarırız
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.future.done():
+                # Tam sınırda slot verilmiş -> devam
+                return waiter
+            self._remove(lane, waiter)
+            self.rejected_timeout += 1
+            raise Overloaded(self.retry_after(), "queue_timeout")
+        except asyncio.CancelledError:
+            if waiter.future.done():
+                # Slot verilmişti ama istek iptal oldu -> slotu geri ver
+                self.release(waiter)
+            else:
+                self._remove(lane, waiter)
+            raise
+        return waiter
+
+    def release(self, waiter: _Waiter) -> None:
+        held = time.monotonic() - waiter.granted_at
+        self._service_seconds = 0.9 * self._service_seconds + 0.1 * held
+
+        user_id = waiter.user_id
+        self._active -= 1
+        remaining = self._user_inflight.get(user_id, 1) - 1
+        if remaining > 0:
+            self._user_inflight[user_id] = remaining
+        else:
+            self._user_inflight.pop(user_id, None)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, plan: Optional[str]):
+        plan = plan or DEFAULT_PLAN
+        waiter = await self.acquire(user_id, plan)
+        try:
+            yield
+        finally:
+            self.release(waiter)
+
+    def configure(
+        self,
+        max_concurrency: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        queue_timeout: Optional[float] = None,
+    ) -> None:
+        """
+        Limitleri çalışırken değiştir (admin endpoint'i). Artan kapasite hemen dağıtılır.
+        """
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+        if max_queue is not None:
+            self.max_queue = max_queue
+        if queue_timeout is not None:
+            self.queue_timeout = queue_timeout
+        self._dispatch()
+
+    def set_plan_limits(self, weights: dict, user_caps: dict) -> None:
+        """
+        Plan ağırlıkları / kullanıcı başı sınırlar (plans.py cache'i yenilenince).
+        """
+        self.weights = weights
+        self.user_caps = user_caps
+        for plan, lane in self._lanes.items():
+            lane.weight = weights.get(plan, DEFAULT_WEIGHT)
+        self._dispatch()
+
+    def limits(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+        }
+
+    # ---------- iç mantık ----------
+    def _user_queued(self, user_id: int, plan: Optional[str]) -> int:
+        lane = self._lanes.get(plan)
+        queue = lane.users.get(user_id) if lane is not None else None
+        return len(queue) if queue is not None else 0
+
+    def _user_queue_limit(self) -> int:
+        return max(1, self.max_queue // SCHEDULER_USER_QUEUE_SHARE)
+
+    def _remove(self, lane: _PlanLane, waiter: _Waiter) -> None:
+        queue = lane.users.get(waiter.user_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            lane.queued -= 1
+            self._queued -= 1
+            if not queue:
+                del lane.users[waiter.user_id]
+
+    def _pop_eligible(self, lane: _PlanLane, cap: int) -> Optional[_Waiter]:
+        """
+        Round-robin: in-flight sınırı dolmamış ilk kullanıcının ilk işini alır,
+        kullanıcıyı sıranın sonuna atar.
+        """
+        for user_id, queue in lane.users.items():
+            if self._user_inflight.get(user_id, 0) >= cap:
+                continue
+            waiter = queue.popleft()
+            lane.queued -= 1
+            self._queued -= 1
+            if queue:
+                lane.users.move_to_end(user_id)
+            else:
+                del lane.users[user_id]
+            return waiter
+        return None
+
+    def _dispatch(self) -> None:
+        while self._active < self.max_concurrency:
+            # Bekleyeni olan planlar, pass değeri küçükten büyüğe
+            lanes = sorted(
+                ((plan, lane) for plan, lane in self._lanes.items() if lane.queued),
+                key=lambda item: item[1].pass_value,
+            )
+
+            waiter = None
+            for plan, lane in lanes:
+                waiter = self._pop_eligible(lane, self._user_cap(plan))
+                if waiter is not None:
+                    self._virtual_time = lane.pass_value
+                    lane.pass_value += 1.0 / lane.weight
+                    lane.record_wait(time.monotonic() - waiter.enqueued_at)
+                    break
+
+            if waiter is None:
+                return
+
+            self._active += 1
+            self._user_inflight[waiter.user_id] = self._user_inflight.get(waiter.user_id, 0) + 1
+            waiter.granted_at = time.monotonic()
+            waiter.future.set_result(None)
+
+    def stats(self) -> dict:
+        plans = {}
+        for plan, lane in self._lanes.items():
+            waits = sorted(lane.recent_waits)
+            plans[plan] = {
+                "weight": lane.weight,
+                "user_inflight_cap": self._user_cap(plan),
+                "queued": lane.queued,
+                "queued_users": len(lane.users),
+                "granted": lane.granted,
+                "wait_ms_avg": round(lane.wait_seconds_total / lane.granted * 1000, 2) if lane.granted else 0.0,
+                "wait_ms_p50": round(waits[len(waits) // 2] * 1000, 2) if waits else 0.0,
+                "wait_ms_p95": round(waits[int(len(waits) * 0.95)] * 1000, 2) if waits else 0.0,
+                "wait_ms_max": round(lane.wait_seconds_max * 1000, 2),
+            }
+        return {
+            **self.limits(),
+            "active": self._active,
+            "queued": self._queued,
+            "service_seconds_ewma": round(self._service_seconds, 3),
+            "retry_after": self.retry_after(),
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_user_queue_full": self.rejected_user_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "plans": plans,
+        }
+
+
+scheduler = FairScheduler(
+    max_concurrency=SCHEDULER_MAX_CONCURRENCY,
+    weights=PLAN_WEIGHTS,
+    user_caps=USER_INFLIGHT_CAPS,
+    max_queue=SCHEDULER_MAX_QUEUE,
+    queue_timeout=SCHEDULER_QUEUE_TIMEOUT,
+)
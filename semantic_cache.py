@@ -0,0 +1,227 @@
+# semantic_cache.py
+import os
+import time
+import struct
+import hashlib
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+from cache import PROMPT_VERSION, normalize_text
+
+# ------------------------------------------------------------
+# Semantik (yakın kopya) cache ayarları (.env ile değiştirilebilir)
+# Varsayılan kapalı: açıklaması bir kelime/emoji farklı olan istek,
+# daha önce üretilmiş sonucu alır.
+# ------------------------------------------------------------
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.8"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "100000"))
+SEMANTIC_CACHE_MAX_BYTES = int(os.getenv("SEMANTIC_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# MinHash LSH: BANDS x ROWS permütasyon.
+# s=0.8 benzerlikte aday bulma olasılığı 1 - (1 - 0.8^4)^8 ~ %98.5,
+# alakasız metinlerde (s~0.1) ~ %0.08 -> doğrulanacak aday sayısı küçük kalır
+SHINGLE_SIZE = 3
+BANDS = 8
+ROWS = 4
+
+# Her n-gram için tek bir blake2b çağrısı BANDS*ROWS adet 16-bit hash üretir
+# (blake2b en fazla 64 byte -> 32 x 16-bit); imza = her sütunun minimumu
+_NUM_HASHES = BANDS * ROWS
+_UNPACK = struct.Struct(f"<{_NUM_HASHES}H").unpack
+
+
+# ------------------------------------------------------------
+# Vektörleştirme (tamamen lokal, ağ / embedding API yok)
+# ------------------------------------------------------------
+def canonical_text(text: str) -> str:
+    """
+    normalize_text + emoji / noktalama temizliği. Sadece harf, rakam ve boşluk kalır.
+    """
+    text = normalize_text(text)
+    kept = [ch if unicodedata.category(ch)[0] in ("L", "N") else " " for ch in text]
+    return " ".join("".join(kept).split())
+
+
+def shingles(text: str) -> set:
+    """
+    Karakter n-gram kümesi (başa/sona boşluk eklenerek).
+    """
+    padded = f" {text} "
+    if len(padded) <= SHINGLE_SIZE:
+        return {padded}
+    return {padded[i:i + SHINGLE_SIZE] for i in range(len(padded) - SHINGLE_SIZE + 1)}
+
+
+def band_keys(shingle_set: set) -> list:
+    """
+    MinHash imzasını BANDS parçaya bölüp her parçayı tek bir int bucket key'e çevirir.
+    """
+    rows = [
+        _UNPACK(hashlib.blake2b(gram.encode("utf-8"), digest_size=_NUM_HASHES * 2).digest())
+        for gram in shingle_set
+    ]
+    signature = [min(column) for column in zip(*rows)]
+    return [
+        hash((band,) + tuple(signature[band * ROWS:(band + 1) * ROWS]))
+        for band in range(BANDS)
+    ]
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    inter = len(a & b)
+    return inter / (len(a) + len(b) - inter)
+
+
+# ------------------------------------------------------------
+# Niş başına LSH index + global LRU
+# ------------------------------------------------------------
+class SemanticCache:
+    """
+    Niş başına bir LSH index'i tutar; benzerlik eşiği geçilirse cache'teki sonucu döner.
+    - Adaylar LSH bucket'larından gelir, sonra gerçek n-gram Jaccard'ı ile doğrulanır.
+    - Bellek sınırı: max_entries kayıt ve max_bytes sonuç boyutu, aşılınca LRU silinir.
+    - Kayıtta sadece kanonik metin ve sonuç tutulur; bucket key'leri silmede yeniden hesaplanır.
+    Sadece event loop içinden kullanılıyor, kilit gerekmez.
+    """
+
+    def __init__(self, threshold: float, max_entries: int, max_bytes: int):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()  # id -> (niche_key, text, result)
+        self._indexes: dict = {}  # niche_key -> {bucket_key: id veya [id, ...]}
+        self._next_id = 0
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lookup_seconds = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _niche_key(niche: str) -> str:
+        return f"{PROMPT_VERSION}\x1f{normalize_text(niche)}"
+
+    # ---------- okuma ----------
+    def get(self, niche: str, description: str) -> Optional[str]:
+        started = time.perf_counter()
+        try:
+            return self._get(niche, description)
+        finally:
+            self.lookup_seconds += time.perf_counter() - started
+
+    def _get(self, niche: str, description: str) -> Optional[str]:
+        index = self._indexes.get(self._niche_key(niche))
+        text = canonical_text(description)
+        if index is None or not text:
+            self.misses += 1
+            return None
+
+        query = shingles(text)
+        seen = set()
+        best_id, best_score = None, self.threshold
+
+        for key in band_keys(query):
+            bucket = index.get(key)
+            if bucket is None:
+                continue
+            for entry_id in (bucket if isinstance(bucket, list) else (bucket,)):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                score = jaccard(query, shingles(self._entries[entry_id][1]))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+        if best_id is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(best_id)
+        self.hits += 1
+        return self._entries[best_id][2]
+
+    # ---------- yazma ----------
+    def add(self, niche: str, description: str, result: str) -> None:
+        text = canonical_text(description)
+        size = len(result.encode("utf-8")) + len(text)
+        if not text or size > self.max_bytes:
+            return
+
+        niche_key = self._niche_key(niche)
+        index = self._indexes.setdefault(niche_key, {})
+
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (niche_key, text, result)
+        self._bytes += size
+
+        for key in band_keys(shingles(text)):
+            bucket = index.get(key)
+            if bucket is None:
+                index[key] = entry_id
+            elif isinstance(bucket, list):
+                bucket.append(entry_id)
+            else:
+                index[key] = [bucket, entry_id]
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._evict_oldest()
+
+    def _evict_oldest(self) -> None:
+        entry_id, (niche_key, text, result) = self._entries.popitem(last=False)
+        self._bytes -= len(result.encode("utf-8")) + len(text)
+        self.evictions += 1
+
+        index = self._indexes[niche_key]
+        for key in band_keys(shingles(text)):
+            bucket = index.get(key)
+            if bucket == entry_id:
+                del index[key]
+            elif isinstance(bucket, list):
+                bucket.remove(entry_id)
+                if len(bucket) == 1:
+                    index[key] = bucket[0]
+
+        if not index:
+            del self._indexes[niche_key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._indexes.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "niches": len(self._indexes),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "avg_lookup_us": round(self.lookup_seconds / lookups * 1e6, 1) if lookups else 0.0,
+        }
+
+
+semantic_cache = (
+    SemanticCache(
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+        max_bytes=SEMANTIC_CACHE_MAX_BYTES,
+    )
+    if SEMANTIC_CACHE_ENABLED
+    else None
+)
@@ -2,11 +2,18 @@
 import sys
 from sqlalchemy.orm import Session
 
-from database import SessionLocal
-from models import User
+from auth import bump_token_version, ensure_token_version_column
+from database import Base, SessionLocal, engine
+from models import Plan, User
+from plans import plan_cache
 
 
 def set_user_plan(email: str, plan: str = "pro") -> None:
+    # API hiç açılmamış eski caption.db: plans tablosu / token_version kolonu yoksa ekle
+    Base.metadata.create_all(bind=engine)
+    ensure_token_version_column(engine)
+    plan_cache.load()  # plans tablosu boşsa varsayılan planları yazar
+
     db: Session = SessionLocal()
     try:
         user = db.query(User).filter(User.email == email).first()
@@ -14,8 +21,15 @@ def set_user_plan(email: str, plan: str = "pro") -> None:
             print(f"[X] Kullanici bulunamadi: {email}")
             return
 
+        if db.get(Plan, plan) is None:
+            names = ", ".join(name for (name,) in db.query(Plan.name).order_by(Plan.name))
+            print(f"[X] Plan bulunamadi: {plan} (gecerli planlar: {names})")
+            return
+
         old_plan = user.plan
         user.plan = plan
+        # Eski plan claim'li token'lar çalışan API'de en geç TOKEN_VERSION_TTL içinde reddedilir
+        bump_token_version(user)
         db.commit()
         db.refresh(user)
 
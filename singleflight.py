@@ -0,0 +1,109 @@
+# singleflight.py
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+
+class LeaderCancelled(Exception):
+    """
+    Leader'ın isteği iptal edildi (client koptu); follower kendi üretimini yapmalı.
+    """
+
+
+class SingleFlight:
+    """
+    Aynı key ile aynı anda gelen istekleri tek bir upstream çağrısında birleştirir.
+    - İlk gelen "leader" olur ve gerçekten üretir.
+    - Sonrakiler leader'ın future'ını bekler, aynı sonucu (veya hatayı) alır.
+    Sadece event loop içinden kullanılıyor, kilit gerekmez.
+    """
+
+    def __init__(self):
+        self._flights: dict = {}  # key -> asyncio.Future
+
+        self.leaders = 0  # gerçekten upstream'e giden çağrılar
+        self.shared = 0   # başkasının sonucunu paylaşan çağrılar (= kurtarılan upstream çağrısı)
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    # ---------- düşük seviye (stream akışı kendi leader'lığını yönetir) ----------
+    async def follow(self, key: str) -> Optional[str]:
+        """
+        Key için uçuşta bir üretim varsa bitmesini bekleyip sonucunu döner.
+        Uçuşta üretim yoksa None döner -> çağıran lead() ile leader olmalı.
+        """
+        while True:
+            future = self._flights.get(key)
+            if future is None:
+                return None
+
+            self.shared += 1
+            try:
+                # shield: bir follower iptal edilirse ortak future iptal olmasın
+                return await asyncio.shield(future)
+            except LeaderCancelled:
+                # Leader gitti -> bu bekleyen leader olabilir
+                self.shared -= 1
+
+    def lead(self, key: str) -> asyncio.Future:
+        """
+        Çağıran leader olur; işi bitince finish() çağırmak zorunda.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._flights[key] = future
+        self.leaders += 1
+        return future
+
+    def finish(
+        self,
+        key: str,
+        future: asyncio.Future,
+        result: Optional[str] = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        if self._flights.get(key) is future:
+            del self._flights[key]
+        if future.done():
+            return
+
+        if error is not None and not isinstance(error, Exception):
+            # CancelledError / GeneratorExit: follower'lar kendileri denesin
+            error = LeaderCancelled()
+
+        if error is not None:
+            future.set_exception(error)
+            # Bekleyen yoksa "exception was never retrieved" uyarısı basılmasın
+            future.exception()
+        else:
+            future.set_result(result)
+
+    # ---------- yüksek seviye ----------
+    async def do(self, key: str, fn: Callable[[], Awaitable[str]]) -> str:
+        """
+        fn() uçuşta değilse çalıştırır, uçuştaysa sonucunu bekler.
+        """
+        shared = await self.follow(key)
+        if shared is not None:
+            return shared
+
+        future = self.lead(key)
+        try:
+            result = await fn()
+        except BaseException as exc:
+            self.finish(key, future, error=exc)
+            raise
+        self.finish(key, future, result=result)
+        return result
+
+    def stats(self) -> dict:
+        calls = self.leaders + self.shared
+        return {
+            "in_flight": len(self._flights),
+            "calls": calls,
+            "upstream_calls": self.leaders,
+            "upstream_calls_saved": self.shared,
+            "saved_ratio": round(self.shared / calls, 4) if calls else 0.0,
+        }
+
+
+flights = SingleFlight()
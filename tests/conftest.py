@@ -0,0 +1,10 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+# database.py caption.db'yi, quota_counters.py sayaç dosyasını çalışma klasöründe açıyor:
+# uygulama modülleri import edilmeden önce geçici klasöre geç (repodaki caption.db'ye dokunulmasın)
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+os.chdir(tempfile.mkdtemp(prefix="caption-tests-"))
@@ -0,0 +1,79 @@
+# tests/test_auth_loop_blocking.py
+"""
+/auth/login ve /auth/me event loop'u bloklamamalı: bcrypt process havuzunda,
+DB işi threadpool'da, token doğrulama cache'ten. Paralel login + /me trafiği
+sırasında loop_monitor'ün gördüğü en uzun gecikme sınırın altında kalmalı.
+(Ayrıntılı karşılaştırma: bench_auth_loop.py)
+"""
+import asyncio
+
+import httpx
+import pytest
+
+import main
+from loop_monitor import LoopMonitor
+from passwords import password_hasher
+
+EMAIL = "loop@example.com"
+PASSWORD = "loop-password-123"
+LOGINS = 8
+# /me istekleri bu kadar paralel istemciden sırayla gelir; 200 coroutine'i aynı anda
+# başlatmak, tek loop turunda 200 adım biriktirir (ölçülen şey istemcinin kendi yükü olur)
+ME_CLIENTS = 10
+ME_REQUESTS = 200
+# Tek bir bcrypt hash'i (~250 ms hedef) loop'ta çalışsaydı bunu rahatça aşardı
+MAX_LOOP_STALL_MS = 50
+
+
+@pytest.fixture(scope="module")
+def client_loop():
+    loop = asyncio.new_event_loop()
+    # İlk login spawn / kalibrasyon maliyetini ödemesin (api.py lifespan'i gibi)
+    loop.run_until_complete(password_hasher.start())
+    yield loop
+    password_hasher.shutdown()
+    loop.close()
+
+
+async def _traffic() -> dict:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post("/auth/register", json={"email": EMAIL, "password": PASSWORD})
+        assert response.status_code == 200, response.text
+
+        async def login() -> str:
+            response = await client.post("/auth/login", data={"username": EMAIL, "password": PASSWORD})
+            assert response.status_code == 200, response.text
+            return response.json()["access_token"]
+
+        token = await login()
+        headers = {"Authorization": f"Bearer {token}"}
+
+        async def me():
+            response = await client.get("/auth/me", headers=headers)
+            assert response.status_code == 200, response.text
+
+        async def me_client():
+            for _ in range(ME_REQUESTS // ME_CLIENTS):
+                await me()
+
+        # FastAPI route bağlamını ilk istekte kuruyor (tek seferlik, auth'tan bağımsız)
+        await me()
+
+        monitor = LoopMonitor(interval=0.005, threshold_ms=MAX_LOOP_STALL_MS)
+        monitor.start()
+        try:
+            await asyncio.gather(*(login() for _ in range(LOGINS)), *(me_client() for _ in range(ME_CLIENTS)))
+            # Son nabız örneği de alınsın
+            await asyncio.sleep(0.02)
+        finally:
+            monitor.stop()
+        return monitor.stats()
+
+
+def test_login_and_me_do_not_stall_event_loop(client_loop):
+    stats = client_loop.run_until_complete(_traffic())
+
+    assert stats["samples"] > 0
+    assert stats["lag_ms_max"] < MAX_LOOP_STALL_MS, stats
+    assert stats["blocks"] == 0, stats
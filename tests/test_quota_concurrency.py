@@ -0,0 +1,109 @@
+# tests/test_quota_concurrency.py
+"""
+Paralel reserve() çağrıları limiti aşamaz: N thread aynı kullanıcı için yarışır,
+limit K ise tam K tanesi geçer. Hem caption_usages (tek statement upsert) hem
+paylaşılan sayaç dosyası yolu, hem günlük hem aylık limit için.
+"""
+import asyncio
+import itertools
+import threading
+from datetime import date, datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import quota
+from database import Base, SessionLocal, engine
+from models import CaptionUsage, Plan, User
+from plans import plan_cache
+from quota_counters import QuotaCounters
+
+THREADS = 24
+LIMIT = 5
+
+_emails = itertools.count()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def plans_table():
+    Base.metadata.create_all(bind=engine)
+    quota.ensure_usage_index(engine)
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        db.merge(Plan(name="test_daily", daily_limit=LIMIT, monthly_limit=None, max_batch_items=100, updated_at=now))
+        db.merge(Plan(name="test_monthly", daily_limit=None, monthly_limit=LIMIT, max_batch_items=100, updated_at=now))
+        db.commit()
+    finally:
+        db.close()
+    plan_cache.load()
+
+
+@pytest.fixture(params=["usages_table", "counters"])
+def store(request, monkeypatch, tmp_path):
+    counters = QuotaCounters(str(tmp_path / "counters.db")) if request.param == "counters" else None
+    monkeypatch.setattr(quota, "quota_counters", counters)
+    return counters
+
+
+def _create_user(plan: str) -> User:
+    db = SessionLocal()
+    try:
+        user = User(email=f"race{next(_emails)}@example.com", hashed_password="x", plan=plan)
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        db.expunge(user)
+        return user
+    finally:
+        db.close()
+
+
+def _race(user: User) -> int:
+    barrier = threading.Barrier(THREADS)
+    admitted = []
+
+    def worker():
+        db = SessionLocal()
+        try:
+            barrier.wait()
+            asyncio.run(quota.reserve(db, user))
+            admitted.append(True)
+        except HTTPException as exc:
+            assert exc.status_code == 403
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(admitted)
+
+
+def test_daily_limit_is_not_over_admitted(store):
+    user = _create_user("test_daily")
+    assert _race(user) == LIMIT
+
+
+def test_monthly_limit_is_not_over_admitted(store):
+    user = _create_user("test_monthly")
+
+    # Ayın önceki bir gününde kullanım varsa aylık toplam onu da saymalı
+    used_before = 0
+    today = date.today()
+    if today.day > 1:
+        used_before = 2
+        earlier = today - timedelta(days=1)
+        if store is not None:
+            store.load([(user.id, earlier, used_before)])
+        else:
+            db = SessionLocal()
+            try:
+                db.add(CaptionUsage(user_id=user.id, date=earlier, count=used_before))
+                db.commit()
+            finally:
+                db.close()
+
+    assert _race(user) == LIMIT - used_before
@@ -0,0 +1,63 @@
+# tests/test_scheduler.py
+"""
+Sıra sınırı, global slot boşken de geçerli: kullanıcı başı in-flight sınırında
+bekleyen işler sırayı sınırsız büyütemez.
+"""
+import asyncio
+
+from scheduler import FairScheduler, Overloaded
+
+
+def _scheduler(max_queue: int) -> FairScheduler:
+    return FairScheduler(
+        max_concurrency=64,
+        weights={"pro": 4.0, "free": 1.0},
+        user_caps={"pro": 4, "free": 1},
+        max_queue=max_queue,
+        queue_timeout=5.0,
+    )
+
+
+async def _flood(scheduler: FairScheduler, calls: int, user_ids) -> tuple:
+    hold = asyncio.Event()
+
+    async def call(user_id: int):
+        async with scheduler.slot(user_id, "pro"):
+            await hold.wait()
+
+    tasks = [asyncio.ensure_future(call(user_ids(i))) for i in range(calls)]
+    await asyncio.sleep(0.05)
+    snapshot = scheduler.stats()
+    hold.set()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    return snapshot, results
+
+
+def test_single_user_cannot_grow_queue_past_limit():
+    scheduler = _scheduler(max_queue=10)
+    snapshot, results = asyncio.run(_flood(scheduler, 300, lambda i: 1))
+
+    rejected = [r for r in results if isinstance(r, Overloaded)]
+    # 4 slot (pro in-flight sınırı) + kullanıcının sıra payı; gerisi hemen 429
+    assert snapshot["active"] == 4
+    assert snapshot["queued"] <= 10
+    assert len(rejected) == 300 - 4 - snapshot["queued"]
+    assert all(r is None for r in results if not isinstance(r, Overloaded))
+
+
+def test_total_queue_is_bounded_across_users():
+    scheduler = _scheduler(max_queue=10)
+    scheduler.configure(max_concurrency=2)
+    snapshot, results = asyncio.run(_flood(scheduler, 100, lambda i: i))
+
+    assert snapshot["active"] == 2
+    assert snapshot["queued"] == 10
+    assert sum(isinstance(r, Overloaded) for r in results) == 100 - 2 - 10
+
+
+def test_zero_queue_still_admits_while_slots_are_free():
+    scheduler = _scheduler(max_queue=0)
+    snapshot, results = asyncio.run(_flood(scheduler, 3, lambda i: i))
+
+    assert snapshot["active"] == 3
+    assert not any(isinstance(r, Overloaded) for r in results)
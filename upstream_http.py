@@ -0,0 +1,118 @@
+# upstream_http.py
+import os
+import time
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------
+# Upstream HTTP transport ayarları (.env ile değiştirilebilir)
+# ------------------------------------------------------------
+# Tek worker yüzlerce eşzamanlı üretim tutabilsin diye havuz geniş tutuluyor
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "200"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "50"))
+# Boştaki bağlantı bu kadar saniye açık tutulur (httpx varsayılanı 5 sn, cold start'a yol açıyor)
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "90"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+# HTTP/2: tek bağlantıda çoklu istek; "h2" paketi gerekir (pip install h2)
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "0") == "1"
+# Açılışta önceden açılacak bağlantı sayısı (0 -> kapalı)
+LLM_WARMUP_CONNECTIONS = int(os.getenv("LLM_WARMUP_CONNECTIONS", "4"))
+# Trafik yokken bağlantıyı sıcak tutmak için bu aralıkla hafif istek (0 -> kapalı)
+LLM_KEEPWARM_SECONDS = float(os.getenv("LLM_KEEPWARM_SECONDS", "60"))
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class ConnectionMetrics:
+    """
+    httpcore trace event'lerinden bağlantı açma / yeniden kullanma sayaçları.
+    Her isteğe request hook'u ile bir trace callback'i takılır.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.connect_seconds_total = 0.0  # TCP + TLS
+        self.connect_seconds_max = 0.0
+        self.tls_seconds_total = 0.0
+        self.connect_failures = 0
+        self.http2_requests = 0
+
+    async def on_request(self, request: httpx.Request) -> None:
+        state = {"connect_started": None, "tls_started": None, "connected": False}
+
+        async def trace(event: str, info: dict) -> None:
+            now = time.perf_counter()
+            if event == "connection.connect_tcp.started":
+                state["connect_started"] = now
+            elif event == "connection.start_tls.started":
+                state["tls_started"] = now
+            elif event == "connection.start_tls.complete" and state["tls_started"] is not None:
+                self.tls_seconds_total += now - state["tls_started"]
+            elif event in ("connection.connect_tcp.failed", "connection.start_tls.failed"):
+                self.connect_failures += 1
+            elif event.endswith("send_request_headers.started"):
+                self.requests += 1
+                if event.startswith("http2."):
+                    self.http2_requests += 1
+                if state["connect_started"] is not None and not state["connected"]:
+                    state["connected"] = True
+                    elapsed = now - state["connect_started"]
+                    self.new_connections += 1
+                    self.connect_seconds_total += elapsed
+                    self.connect_seconds_max = max(self.connect_seconds_max, elapsed)
+                elif not state["connected"]:
+                    self.reused_connections += 1
+
+        request.extensions["trace"] = trace
+
+    def stats(self) -> dict:
+        return {
+            "http2_enabled": LLM_HTTP2 and _http2_available(),
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+            "reuse_ratio": round(self.reused_connections / self.requests, 4) if self.requests else 0.0,
+            "connect_ms_avg": (
+                round(self.connect_seconds_total / self.new_connections * 1000, 2) if self.new_connections else 0.0
+            ),
+            "connect_ms_max": round(self.connect_seconds_max * 1000, 2),
+            "tls_ms_total": round(self.tls_seconds_total * 1000, 2),
+            "connect_failures": self.connect_failures,
+            "http2_requests": self.http2_requests,
+        }
+
+
+connection_metrics = ConnectionMetrics()
+
+
+def build_http_client() -> httpx.AsyncClient:
+    """
+    Tüm upstream istekleri bu tek client'ın bağlantı havuzunu paylaşır.
+    """
+    http2 = LLM_HTTP2
+    if http2 and not _http2_available():
+        logger.warning("LLM_HTTP2=1 ama 'h2' paketi kurulu degil; HTTP/1.1 ile devam ediliyor.")
+        http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT),
+        event_hooks={"request": [connection_metrics.on_request]},
+    )
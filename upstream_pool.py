@@ -0,0 +1,158 @@
+# upstream_pool.py
+import os
+import math
+import time
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from ratelimit import LLM_RPM_LIMIT, LLM_THROTTLE_MAX_WAIT, LLM_TPM_LIMIT, UpstreamRateLimiter
+from scheduler import Overloaded
+
+# ------------------------------------------------------------
+# Key havuzu ayarları (.env ile değiştirilebilir)
+# OPENAI_API_KEYS="sk-aaa:2,sk-bbb:1"  (":ağırlık" opsiyonel)
+# Tanımlı değilse tek key olarak OPENAI_API_KEY kullanılır.
+# ------------------------------------------------------------
+# Kotası biten key bu kadar süre sonra tekrar denenir (auth hatası kalıcı)
+LLM_KEY_QUOTA_COOLDOWN = float(os.getenv("LLM_KEY_QUOTA_COOLDOWN", "3600"))
+# Tüm key'ler auth hatasıyla (süresiz) kapalıysa client'a önerilen bekleme
+_AUTH_DISABLED_RETRY_AFTER = 60
+
+
+def parse_api_keys(raw: str) -> list:
+    """
+    "sk-aaa:2,sk-bbb" -> [("sk-aaa", 2.0), ("sk-bbb", 1.0)]
+    """
+    keys = []
+    for part in raw.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        key, _, weight = part.partition(":")
+        keys.append((key.strip(), float(weight) if weight else 1.0))
+    return keys
+
+
+def mask_key(api_key: str) -> str:
+    # Metriklerde / loglarda key'in tamamı görünmesin
+    return f"{api_key[:3]}...{api_key[-4:]}" if len(api_key) > 8 else "***"
+
+
+class UpstreamKey:
+    """
+    Tek bir OpenAI key'i: kendi client'ı, rate limit bütçesi ve sağlık durumu.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        weight: float,
+        http_client: httpx.AsyncClient,
+        base_url: Optional[str] = None,
+    ):
+        self.name = mask_key(api_key)
+        self.weight = weight
+        # Retry / timeout politikası resilience.py'de; SDK'nın kendi retry'ı kapalı
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=http_client,
+            max_retries=0,
+        )
+        self.limiter = UpstreamRateLimiter(
+            rpm=LLM_RPM_LIMIT,
+            tpm=LLM_TPM_LIMIT,
+            max_wait=LLM_THROTTLE_MAX_WAIT,
+        )
+
+        self.in_flight = 0
+        self.disabled_reason: Optional[str] = None
+        self.disabled_until = 0.0  # 0 -> kalıcı (auth), >0 -> bu zamana kadar (kota)
+
+        self.requests = 0
+        self.errors = 0
+        self.tokens = 0
+        self.last_error: Optional[str] = None
+
+    def available(self) -> bool:
+        if self.disabled_reason is None:
+            return True
+        if self.disabled_until and time.monotonic() >= self.disabled_until:
+            # Kota süresi doldu -> tekrar dene
+            self.disabled_reason = None
+            self.disabled_until = 0.0
+            return True
+        return False
+
+    def disable(self, reason: str, cooldown: Optional[float] = None) -> None:
+        self.disabled_reason = reason
+        self.disabled_until = time.monotonic() + cooldown if cooldown else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "key": self.name,
+            "weight": self.weight,
+            "available": self.available(),
+            "disabled_reason": self.disabled_reason,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "tokens": self.tokens,
+            "last_error": self.last_error,
+            "rate_limit": self.limiter.stats(),
+        }
+
+
+class NoUpstreamKey(Overloaded):
+    """
+    Havuzdaki tüm key'ler devre dışı (auth / kota) -> 503 + Retry-After
+    (en kısa kalan kota cooldown'u).
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__(retry_after, "no_upstream_key")
+
+
+class KeyPool:
+    """
+    Birden fazla key arasında yük dağıtımı.
+    Seçim sırası: rate limit bütçesi için en az bekleyecek key, sonra ağırlığa göre
+    en az yüklü (in-flight), eşitlikte ağırlığa göre en az kullanılmış.
+    Kapasite, replica yerine key ekleyerek büyütülebilir.
+    """
+
+    def __init__(self, keys: list, http_client: httpx.AsyncClient, base_url: Optional[str] = None):
+        self.base_url = base_url
+        self.keys = [UpstreamKey(api_key, weight, http_client, base_url) for api_key, weight in keys]
+
+    def pick(self, estimated_tokens: int, exclude: tuple = ()) -> UpstreamKey:
+        candidates = [k for k in self.keys if k not in exclude and k.available()]
+        if not candidates:
+            raise NoUpstreamKey(self.retry_after())
+        return min(
+            candidates,
+            key=lambda k: (
+                round(k.limiter.wait_estimate(estimated_tokens), 1),
+                k.in_flight / k.weight,
+                k.requests / k.weight,
+            ),
+        )
+
+    def retry_after(self) -> int:
+        """
+        Kota yüzünden kapalı key'lerden en erken açılacak olanın kalan süresi (saniye).
+        """
+        now = time.monotonic()
+        remaining = [k.disabled_until - now for k in self.keys if k.disabled_reason and k.disabled_until]
+        if not remaining:
+            return _AUTH_DISABLED_RETRY_AFTER
+        return max(1, math.ceil(min(remaining)))
+
+    def stats(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "keys": [key.stats() for key in self.keys],
+            "available": sum(1 for key in self.keys if key.available()),
+        }